@@ -12,11 +12,11 @@ import app.n02_local as n02
 import app.n03_online as n03
 import app.n04_fine as n04
 import app.mvp as mvp
+import app.data as data
 
-import lib.utils
-
-questoes = lib.utils.load_json('./data/questoes/questoes.json')
-predicts = lib.utils.load_json('./data/predict_data/local_predictions.json')
+# Carregados uma única vez por versão dos arquivos (cache compartilhado entre sessões)
+questoes = data.load_questions()
+predicts = data.load_predictions()
 
 pages_dict = {
     'home' : home,
@@ -0,0 +1,95 @@
+import os
+import pandas as pd
+import streamlit as st
+import lib.utils
+from lib.utils import journal_path
+from lib.utils.predictions import PREDICTIONS_FILE
+from lib.utils.questions import QuestionIndex, QUESTIONS_SOURCES, query_questions
+
+# Colunas suficientes para montar o índice ano → disciplina → ids
+INDEX_COLUMNS = ('id', 'year', 'discipline')
+
+def file_version(filename) -> tuple:
+    """Versão de um arquivo JSON: mtime e tamanho do snapshot e do journal de predições."""
+    version = []
+    for path in (filename, journal_path(filename)):
+        try:
+            stat = os.stat(path)
+            version.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            version.append(None)
+    return tuple(version)
+
+# Os JSONs ficam em memória uma única vez, compartilhados entre todas as sessões (somente leitura)
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _load_json(filename, version):
+    return lib.utils.load_json(filename)
+
+def questions_version() -> tuple:
+    """Versão das fontes do Parquet de questões (o Parquet é refeito pelo query_questions quando elas mudam)."""
+    return tuple(version for source in QUESTIONS_SOURCES for version in file_version(source))
+
+# As questões vêm do Parquet, lendo apenas as colunas e os row groups necessários
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _query_questions(version, columns=None) -> list[dict]:
+    return query_questions(columns=list(columns) if columns is not None else None)
+
+def load_questions() -> list[dict]:
+    return _query_questions(questions_version())
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _question_index(version) -> QuestionIndex:
+    return QuestionIndex(_query_questions(version, INDEX_COLUMNS))
+
+def question_index() -> QuestionIndex:
+    """Índice ano → disciplina → ids das questões, reconstruído apenas quando as fontes mudam."""
+    return _question_index(questions_version())
+
+@st.cache_resource(show_spinner=False, max_entries=256)
+def _question(question_id, version) -> dict:
+    return query_questions(ids=[question_id])[0]
+
+def question(question_id) -> dict:
+    """Questão completa, lida do Parquet apenas quando é selecionada."""
+    return _question(question_id, questions_version())
+
+def load_predictions() -> dict[str, dict]:
+    return _load_json(PREDICTIONS_FILE, file_version(PREDICTIONS_FILE))
+
+def data_version() -> tuple:
+    """Versão conjunta das questões e predições, usada como chave das tabelas derivadas."""
+    return questions_version() + file_version(PREDICTIONS_FILE)
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def _test_table(models, questions, version) -> pd.DataFrame:
+    return lib.utils.test_table(questions=list(questions), models=list(models))
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _tri_table(models, questions, version) -> pd.DataFrame:
+    from lib.utils.tri import tri_table
+    return tri_table(list(models), list(questions))
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _tabela_geral(models, questions, version) -> pd.DataFrame:
+    table = lib.utils.tabela_geral(list(questions), list(models))
+    # Mesmo estado que a página via após o analisar_tabela (timeouts com tempo 0)
+    if 'time' in table:
+        table['time'] = table['time'].fillna(0)
+    return table
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _analisar_tabela(models, questions, column, version) -> pd.DataFrame:
+    return lib.utils.analisar_tabela(_tabela_geral(models, questions, version), column)
+
+def test_table(questions, models) -> pd.DataFrame:
+    return _test_table(tuple(models), tuple(questions), data_version())
+
+def tri_table(questions, models) -> pd.DataFrame:
+    """Nota TRI (escala do ENEM) de cada modelo por área, recalculada apenas quando as predições mudam."""
+    return _tri_table(tuple(models), tuple(questions), data_version())
+
+def tabela_geral(questions, models) -> pd.DataFrame:
+    return _tabela_geral(tuple(models), tuple(questions), data_version())
+
+def analisar_tabela(questions, models, column) -> pd.DataFrame:
+    return _analisar_tabela(tuple(models), tuple(questions), column, data_version())
@@ -1,9 +1,12 @@
 import streamlit as st
 import os
+import uuid
 from dotenv import load_dotenv, find_dotenv
 import google.generativeai as genai
 import lib.models_help.build
 import lib.models_help
+from lib.models_help.chat import ChatContext, get_context_store, chat_sessions, payload_bytes
+import app.data as data
 
 # Configuração da API do Gemini
 _ = load_dotenv(find_dotenv())
@@ -48,24 +51,20 @@ def show_question(question):
     for alt in ["A", "B", "C", "D", "E"]:
         st.write(f"**{alt})** {question[alt]}")
 
-def select_question(questoes):
+def select_question(index):
     """Permite selecionar a questão através de filtros de ano, disciplina e ID."""
     col1, col2, col3 = st.columns(3)
 
     with col1:
-        anos = sorted(set(q['year'] for q in questoes))
-        ano_selecionado = st.selectbox("Ano", anos, index=0)
+        ano_selecionado = st.selectbox("Ano", index.years, index=0)
 
     with col2:
-        disciplinas = sorted(set(q['discipline'] for q in questoes if q['year'] == ano_selecionado))
-        disciplina_selecionada = st.selectbox("Disciplina", disciplinas, index=0)
+        disciplina_selecionada = st.selectbox("Disciplina", index.disciplines[ano_selecionado], index=0)
 
     with col3:
-        questoes_filtradas = [q for q in questoes if q['year'] == ano_selecionado and q['discipline'] == disciplina_selecionada]
-        ids_questoes = [q['id'] for q in questoes_filtradas]
-        questao_selecionada = st.selectbox("Questão", ids_questoes, index=0)
+        questao_selecionada = st.selectbox("Questão", index.ids(ano_selecionado, disciplina_selecionada), index=0)
 
-    return next(q for q in questoes if q['id'] == questao_selecionada)
+    return questao_selecionada
 
 def check_gemini(api_key):
     """Verifica se a chave Gemini é válida sem disparar erro."""
@@ -79,7 +78,7 @@ def check_gemini(api_key):
 
 def render(**kwargs):
     """Renderiza a interface principal do chatbot."""
-    questoes = kwargs['questoes']
+    indice = data.question_index()
 
     st.title("💬 MVP")
 
@@ -116,22 +115,30 @@ def render(**kwargs):
     # Se a chave for válida, permitir o uso do chat
     if st.session_state["gemini_api_valid"]:
 
-        questao = select_question(questoes)
-        questao_id = questao['id']
+        questao_id = select_question(indice)
+        questao = data.question(questao_id)
         
         show_question(questao)
 
-        if "chat_history" not in st.session_state:
-            st.session_state.chat_history = {}
+        # O id do aluno fica na URL: recarregar a página recupera os chats gravados em disco
+        if "aluno" not in st.query_params:
+            st.query_params["aluno"] = uuid.uuid4().hex
+        session_id = st.query_params["aluno"]
 
-        if questao_id not in st.session_state.chat_history:
+        if "context_store" not in st.session_state:
+            st.session_state.context_store = get_context_store()
+
+        chat = chat_sessions.get(session_id, questao_id)
+        if chat is None:
             parts, sys_instr = questao_to_parts(questao)
-            st.session_state.chat_history[questao_id] = {
-                'client': genai.GenerativeModel(model_name='gemini-2.0-flash', system_instruction=[sys_instr]),
-                'messages': [{"role": "user", "parts": parts}]
-            }
+            # O chat guarda as imagens inline; o armazenamento da sessão as referencia a cada requisição
+            chat = chat_sessions.put(session_id, questao_id, {
+                'system_instruction': sys_instr,
+                'messages': [{"role": "user", "parts": parts}],
+                'context': ChatContext()
+            })
 
-        for message in st.session_state.chat_history[questao_id]['messages'][1:]:
+        for message in chat['messages'][1:]:
             if message['role'] == 'user':
                 with st.chat_message("user"):
                     st.write(message['parts'][0])
@@ -141,14 +148,18 @@ def render(**kwargs):
 
         if prompt := st.chat_input("Digite sua dúvida sobre a questão..."):
 
-            st.session_state.chat_history[questao_id]['messages'].append({"role": "user", "parts": [prompt]})
+            chat['messages'].append({"role": "user", "parts": [prompt]})
 
             with st.chat_message("user"):
                 st.markdown(prompt)
 
-            model = st.session_state.chat_history[questao_id]['client']
-            content = st.session_state.chat_history[questao_id]['messages']
-                    
+            model = genai.GenerativeModel(model_name='gemini-2.0-flash', system_instruction=[chat['system_instruction']])
+            # Questão fixa + mensagens recentes dentro do orçamento de tokens
+            content, tokens = chat['context'].build(chat['messages'])
+            # As imagens da questão são enviadas uma vez por sessão e depois apenas referenciadas
+            content = st.session_state.context_store.prepare(questao_id, content)
+            tokens['bytes'] = payload_bytes(content)
+
             response = model.generate_content(contents=content, stream=True)
 
             resposta_gemini = ""
@@ -160,5 +171,13 @@ def render(**kwargs):
                     message_placeholder.markdown(resposta_gemini + "▌")
 
                 message_placeholder.markdown(resposta_gemini)
+                st.caption(f"{tokens['tokens']} tokens, {tokens['bytes'] / 1024:.1f} KB enviados ({tokens['summarized']} mensagens resumidas)")
+
+            chat['messages'].append({"role": "model", "parts": [resposta_gemini]})
+            chat_sessions.update(session_id, questao_id, chat)
 
-            st.session_state.chat_history[questao_id]['messages'].append({"role": "model", "parts": [resposta_gemini]})
+        uso = chat_sessions.usage(session_id)
+        st.caption(
+            f"Chats em memória: {uso['bytes'] / 2**20:.1f} de {uso['max_bytes'] / 2**20:.0f} MB "
+            f"({uso['chats']} chats, {uso['session_chats']} seus; {uso['spilled']} gravados em disco)"
+        )
@@ -1,23 +1,36 @@
 import streamlit as st
 import lib.utils as utils
+import app.data as data
 from lib.utils import plots
 import pandas as pd
 import random
 from lib.utils.models_info import models_data
+from lib.utils.figures import figure_cache
 random.seed(42)
 
+TABLE_TYPES = [
+    "Desempenho de Acerto x Erros", "Métricas de Tempo por Modelo", "Tempo Total por Modelo",
+    "Correlação Tamanho x Acurácia", "Correlação Tempo Médio x Acurácia", "Correlação Tempo x Tamanho",
+    "Desempenho por Disciplina (Agrupado por Modelo)", "Desempenho por Disciplina (Agrupado por Disciplina)",
+    "Tempo por Disciplina (Agrupado por Modelo)", "Tempo por Disciplina (Agrupado por Disciplina)",
+    "Vazão de Tokens por Modelo", "Vazão de Tokens por Disciplina", "Diagrama de Venn"
+]
 
-def show_table_metrics(models, questions, table):
-    table_type = [
-        "Desempenho de Acerto x Erros", "Métricas de Tempo por Modelo", "Tempo Total por Modelo",
-        "Correlação Tamanho x Acurácia", "Correlação Tempo Médio x Acurácia", "Correlação Tempo x Tamanho",
-        "Desempenho por Disciplina (Agrupado por Modelo)", "Desempenho por Disciplina (Agrupado por Disciplina)",
-        "Tempo por Disciplina (Agrupado por Modelo)", "Tempo por Disciplina (Agrupado por Disciplina)",
-        "Diagrama de Venn"
-    ]
-    
-    plot_type = st.selectbox("Seelcione uma forma de visualização: ", table_type, index=0, key='unic' + '-'.join(models))
-    
+# Questões utilizadas no teste
+EXAMPLE_TEXT_QUESTIONS = [2011013, 2009066, 2015026, 2014032, 2013088, 2011042, 2010041, 2021090, 2010028, 2023051, 2019054, 2009074, 2009071, 2010033, 2013006, 2014002, 2021048, 2023063, 2009068, 2022062, 2013027, 2019051, 2013063, 2019084, 2023050, 2015058, 2009026, 2012064, 2018134, 2016071, 2012062, 2013079, 2016069, 2011057, 2011051, 2017132, 2011053, 2017104, 2016080, 2023107, 2014089, 2010051, 2019133, 2021118, 2011082, 2017131, 2010081, 2021097, 2015072, 2023099, 2020034, 2016103, 2019044, 2013111, 2022017, 2011103, 2009133, 2021023, 2013099, 2023020, 2014099, 2011109, 2014102, 2011126, 2016115, 2014130, 2017031, 2020045, 2016104, 2012129, 2016108, 2015099, 2013123, 2021030, 2014123, 2021165, 2021142, 2020138, 2009179, 2019153, 2019170, 2011166, 2018161, 2022139, 2013139, 2011162, 2016174, 2015151, 2013166, 2019173, 2021158, 2018169, 2012171, 2021146, 2014168, 2022165, 2022169, 2009175, 2012176, 2009161]
+
+# Grupos de modelos comparados nas tabelas da página
+QWEN_MODELS = ["qwen2.5:14b", "qwen2.5:7b", "qwen2.5:1.5b"]
+GEMMA_MODELS = ["gemma2:2b", "gemma2", "gemma2:27b"]
+REASONING_MODELS = ["deepscaler", "deepseek-r1", "mistral-nemo", "openthinker", "smallthinker"]
+MATH_MODELS = ["qwen2-math:1.5b", "qwen2-math:7b", "mathstral"]
+TEXT_MODELS = ["phi4", "phi3.5", "llava", "llama3.2", "mistral", "mistral-small"]
+ALL_TEXT_MODELS = ["mistral", "phi4", "phi3.5", "llava", "llama3.2",  "mistral-small", "qwen2-math:1.5b", "qwen2-math:7b", "mathstral", "deepscaler", "deepseek-r1", "mistral-nemo", "openthinker", "smallthinker", "gemma2:2b", "gemma2", "gemma2:27b", "qwen2.5:14b", "qwen2.5:7b", "qwen2.5:1.5b"]
+
+REPORT_MODEL_GROUPS = [QWEN_MODELS, GEMMA_MODELS, REASONING_MODELS, MATH_MODELS, TEXT_MODELS, ALL_TEXT_MODELS]
+
+
+def draw_table_metrics(plot_type, models, questions, table):
     match(plot_type):
         case "Desempenho de Acerto x Erros":
             return plots.model_performance(table)
@@ -39,33 +52,100 @@ def show_table_metrics(models, questions, table):
             return plots.discipline_time_performance(models, questions, True)
         case "Tempo por Disciplina (Agrupado por Disciplina)":
             return plots.discipline_time_performance(models, questions, False)
+        case "Vazão de Tokens por Modelo":
+            return plots.throughput_metrics(table)
+        case "Vazão de Tokens por Disciplina":
+            return plots.discipline_throughput(models, questions)
         case "Diagrama de Venn":
-            if len(questions) < 2:
-                st.info("Você precisa selecionar pelo menos duas disciplinas para visualizar o diagrama de Venn.")
-                return None
-            if len(questions) > 3:
-                st.info("Você pode escolher até 3 disciplinas para visualizar o diagrama de Venn.")
-                return None
             return plots.venn_diagram(models, *questions)
         case _:
-            plots.model_performance(table)
+            return plots.model_performance(table)
+
+def show_figure(plot_type, models, questions, draw, **params):
+    """Exibe o gráfico a partir do cache de figuras, renderizando apenas na primeira vez para a versão atual dos dados."""
+    st.image(figure_cache.render(plot_type, models, questions, draw, version=data.data_version(), **params), use_container_width=True)
+
+def show_table_metrics(models, questions, table):
+    plot_type = st.selectbox("Seelcione uma forma de visualização: ", TABLE_TYPES, index=0, key='unic' + '-'.join(models))
+    
+    if plot_type == "Diagrama de Venn":
+        if len(questions) < 2:
+            st.info("Você precisa selecionar pelo menos duas disciplinas para visualizar o diagrama de Venn.")
+            return
+        if len(questions) > 3:
+            st.info("Você pode escolher até 3 disciplinas para visualizar o diagrama de Venn.")
+            return
+    
+    show_figure(plot_type, models, questions, lambda: draw_table_metrics(plot_type, models, questions, table))
+
+def show_tri_table(models, questions):
+    """Nota TRI de cada modelo por área, com os parâmetros dos itens dos microdados do ENEM."""
+    with st.expander("Nota TRI por Área (escala ENEM)"):
+        table = data.tri_table(questions, models)
+        if table.empty:
+            st.info("Nenhuma predição dos modelos selecionados tem item correspondente nos microdados.")
+            return
+        st.dataframe(table.round(1), hide_index=True)
 
 def show_metrics(models,questions):    
     selected_models = st.multiselect("Selecione os modelo desejados: ", models, default=models[0], max_selections=5, key='multi' + '-'.join(models))
     
-    table = utils.test_table(questions=questions,models=selected_models)
+    table = data.test_table(questions, selected_models)
     
     st.dataframe(utils.format_test_table(table))
+
+    show_tri_table(selected_models, questions)
     
-    plot = show_table_metrics(selected_models, questions, table)
-    st.pyplot(plot)
+    show_table_metrics(selected_models, questions, table)
+
 
+def draw_discipline_metrics(models, questions, discipline, mode):
+    return plots.discipline_models(data.tabela_geral(questions, models), discipline, mode)
 
-def show_discipline_metrics(table, discipline):
+def show_discipline_metrics(models, questions, discipline):
     
     plot_type = st.selectbox("Seelcione uma forma de visualização: ", ["Questões Acertadas", "Tempo Médio"], index=0, key=discipline)
+    mode = 'acc' if plot_type == "Questões Acertadas" else 'time'
     
-    st.pyplot(plots.discipline_models(table, discipline, 'acc' if plot_type == "Questões Acertadas" else 'time'))
+    show_figure("discipline_models", models, questions, lambda: draw_discipline_metrics(models, questions, discipline, mode),
+                discipline=discipline, mode=mode)
+
+
+def draw_question_histogram(models, questions, column, max_unique_bins):
+    table_question = data.analisar_tabela(questions, models, 'question')
+    table_question = table_question[table_question['Total'] > 10]
+    return plots.histogram(table_question, column, max_unique_bins)
+
+def show_question_histogram(models, questions, column, max_unique_bins):
+    show_figure("histogram", models, questions, lambda: draw_question_histogram(models, questions, column, max_unique_bins),
+                column=column, max_unique_bins=max_unique_bins)
+
+
+def prewarm_figures():
+    """Renderiza todos os gráficos referenciados pela página (seleção padrão e grupo completo de cada tabela)."""
+    for group in REPORT_MODEL_GROUPS:
+        for models in {tuple(group[:1]), tuple(group[:5])}:
+            models = list(models)
+            table = data.test_table(EXAMPLE_TEXT_QUESTIONS, models)
+            for plot_type in TABLE_TYPES:
+                if plot_type == "Diagrama de Venn":
+                    continue
+                figure_cache.render(plot_type, models, EXAMPLE_TEXT_QUESTIONS,
+                                    lambda: draw_table_metrics(plot_type, models, EXAMPLE_TEXT_QUESTIONS, table),
+                                    version=data.data_version())
+
+    for discipline in ['matematica', 'ciencias-humanas', 'linguagens', 'ciencias-natureza']:
+        for mode in ['acc', 'time']:
+            figure_cache.render("discipline_models", ALL_TEXT_MODELS, EXAMPLE_TEXT_QUESTIONS,
+                                lambda: draw_discipline_metrics(ALL_TEXT_MODELS, EXAMPLE_TEXT_QUESTIONS, discipline, mode),
+                                version=data.data_version(), discipline=discipline, mode=mode)
+
+    for column, max_unique_bins in [('OK', 100), ('Tavg', 4)]:
+        figure_cache.render("histogram", ALL_TEXT_MODELS, EXAMPLE_TEXT_QUESTIONS,
+                            lambda: draw_question_histogram(ALL_TEXT_MODELS, EXAMPLE_TEXT_QUESTIONS, column, max_unique_bins),
+                            version=data.data_version(), column=column, max_unique_bins=max_unique_bins)
+
+    return figure_cache.stats
 
 
 def render(**kwargs):
@@ -134,7 +214,7 @@ def render(**kwargs):
     
     
     # Questões utilizadas no teste
-    example_text_questions  = [2011013, 2009066, 2015026, 2014032, 2013088, 2011042, 2010041, 2021090, 2010028, 2023051, 2019054, 2009074, 2009071, 2010033, 2013006, 2014002, 2021048, 2023063, 2009068, 2022062, 2013027, 2019051, 2013063, 2019084, 2023050, 2015058, 2009026, 2012064, 2018134, 2016071, 2012062, 2013079, 2016069, 2011057, 2011051, 2017132, 2011053, 2017104, 2016080, 2023107, 2014089, 2010051, 2019133, 2021118, 2011082, 2017131, 2010081, 2021097, 2015072, 2023099, 2020034, 2016103, 2019044, 2013111, 2022017, 2011103, 2009133, 2021023, 2013099, 2023020, 2014099, 2011109, 2014102, 2011126, 2016115, 2014130, 2017031, 2020045, 2016104, 2012129, 2016108, 2015099, 2013123, 2021030, 2014123, 2021165, 2021142, 2020138, 2009179, 2019153, 2019170, 2011166, 2018161, 2022139, 2013139, 2011162, 2016174, 2015151, 2013166, 2019173, 2021158, 2018169, 2012171, 2021146, 2014168, 2022165, 2022169, 2009175, 2012176, 2009161]
+    example_text_questions = EXAMPLE_TEXT_QUESTIONS
 
     st.markdown("""
                 ### 2.1 Avaliando o Impacto do Tamanho do Modelo  
@@ -173,7 +253,7 @@ def render(**kwargs):
                 Os gráficos abaixo ilustram esses padrões. Caso esteja acessando via plataforma interativa, você pode **selecionar os modelos e o tipo de gráfico** para comparação personalizada.
                 """)
     
-    show_metrics(["qwen2.5:14b", "qwen2.5:7b", "qwen2.5:1.5b"], example_text_questions)
+    show_metrics(QWEN_MODELS, example_text_questions)
     
     st.markdown("""
                 #### 2.1.2 - Gemma2  
@@ -215,7 +295,7 @@ def render(**kwargs):
                 As informações detalhadas podem ser observadas nos gráficos apresentados a seguir. Além disso, caso o leitor esteja acessando por meio da plataforma interativa, é possível **selecionar os modelos e o tipo de gráfico desejado** para uma análise comparativa personalizada.  
                 """)
     
-    show_metrics(["gemma2:2b", "gemma2", "gemma2:27b"], example_text_questions)
+    show_metrics(GEMMA_MODELS, example_text_questions)
     
     st.markdown("""
                 #### 2.1.3 - Análise Comparativa dos Modelos  
@@ -321,7 +401,7 @@ def render(**kwargs):
                 Os modelos de reasoning apresentaram **vantagens e desvantagens** claras. Enquanto alguns conseguiram **bons desempenhos em acurácia**, houve um **custo expressivo em tempo de inferência**. Além disso, a **tendência a respostas mais elaboradas e menos diretas** pode ser um desafio em aplicações que exigem **alta confiabilidade e aderência estrita às instruções**.                  
                 """)
     
-    show_metrics(["deepscaler", "deepseek-r1", "mistral-nemo", "openthinker", "smallthinker"], example_text_questions)
+    show_metrics(REASONING_MODELS, example_text_questions)
     
     st.markdown("""
                 ### 2.3 - Avaliação de Modelos Focados em Matemática  
@@ -337,7 +417,7 @@ def render(**kwargs):
                 Diante desses resultados, é possível concluir que modelos especializados em matemática **não necessariamente garantem um desempenho superior na disciplina** e, em contrapartida, apresentam **quedas expressivas em outras áreas**, tornando-os menos versáteis. Além disso, a relação entre **tamanho do modelo, tempo de inferência e acurácia** nem sempre segue um padrão linear, como evidenciado pelo desempenho do **Qwen2-Math:1.5B**, que, apesar de menor, apresentou os melhores resultados em sua categoria.
                 """)
     
-    show_metrics(["qwen2-math:1.5b", "qwen2-math:7b", "mathstral"], example_text_questions)
+    show_metrics(MATH_MODELS, example_text_questions)
     
     st.markdown("""
                 ### 2.4 - Avaliação dos Demais Modelos  
@@ -359,7 +439,7 @@ def render(**kwargs):
                 De maneira geral, os modelos analisados nesta seção demonstraram **desempenhos distintos dependendo do critério avaliado**. Enquanto **Phi-4** se destacou pelo equilíbrio entre **tempo de inferência e acurácia**, **Mistral-Small** apresentou resultados robustos, porém com um custo computacional elevado. O modelo **Phi-3.5**, por sua vez, revelou um desempenho impressionante em todas as disciplinas, especialmente em matemática, mas sofreu com um número elevado de respostas inválidas ao longo do teste. Essas diferenças evidenciam que a escolha do modelo ideal deve levar em consideração **não apenas a acurácia bruta, mas também o tempo de inferência, estabilidade das respostas e adequação às tarefas específicas**.                 
                 """)
     
-    show_metrics(["phi4", "phi3.5", "llava", "llama3.2", "mistral", "mistral-small"], example_text_questions)
+    show_metrics(TEXT_MODELS, example_text_questions)
     
     st.markdown("""
                 ### 2.5 - Análise de Desempenho por Disciplina  
@@ -367,15 +447,14 @@ def render(**kwargs):
                 Com a finalização dos testes para cada categoria de modelo, passamos agora a uma análise mais detalhada do **desempenho por disciplina**. O objetivo é compreender como os diferentes modelos se comportam em cada área do conhecimento, identificando padrões, pontos fortes e eventuais limitações em suas respostas.  
                 """)
     
-    all_text_models = ["mistral", "phi4", "phi3.5", "llava", "llama3.2",  "mistral-small", "qwen2-math:1.5b", "qwen2-math:7b", "mathstral", "deepscaler", "deepseek-r1", "mistral-nemo", "openthinker", "smallthinker", "gemma2:2b", "gemma2", "gemma2:27b", "qwen2.5:14b", "qwen2.5:7b", "qwen2.5:1.5b"]
-    text_table = utils.tabela_geral(example_text_questions, all_text_models)
-    table_disciplinas = utils.analisar_tabela(text_table, 'discipline')
+    all_text_models = ALL_TEXT_MODELS
+    table_disciplinas = data.analisar_tabela(example_text_questions, all_text_models, 'discipline')
     st.dataframe(table_disciplinas)
     
     
     st.markdown("#### 2.5.1 - Matemática")
     
-    show_discipline_metrics(text_table, 'matematica')
+    show_discipline_metrics(all_text_models, example_text_questions, 'matematica')
     
     st.markdown("""
                 Em relação ao tempo de execução, as questões de **matemática** apresentaram um tempo médio significativamente superior ao das demais disciplinas, atingindo em média 20,48 segundos por questão, enquanto nas outras áreas do conhecimento nenhuma ultrapassou 8 segundos em média. Essa diferença evidencia que os modelos demandam um tempo consideravelmente maior para processar e responder questões matemáticas, possivelmente devido à necessidade de operações aritméticas ou dificuldades na interpretação das expressões.
@@ -386,7 +465,7 @@ def render(**kwargs):
                 """)
     
     st.markdown("#### 2.5.2 - Ciências Humanas")
-    show_discipline_metrics(text_table, 'ciencias-humanas')
+    show_discipline_metrics(all_text_models, example_text_questions, 'ciencias-humanas')
     st.markdown("""
                 A disciplina de **Ciências Humanas** apresentou um desempenho **superior à maioria das demais áreas**, com uma **acurácia média de 67%** entre os modelos testados. Além disso, o **tempo médio de inferência** foi relativamente **baixo**, sendo **muito próximo ao da disciplina de Linguagens**, com uma diferença de apenas **0,0139 segundos**.  
 
@@ -396,7 +475,7 @@ def render(**kwargs):
                 """)
     
     st.markdown("#### 2.5.3 - Linguagens")
-    show_discipline_metrics(text_table, 'linguagens')
+    show_discipline_metrics(all_text_models, example_text_questions, 'linguagens')
     
     st.markdown("""
                 O desempenho dos modelos na disciplina de **Linguagens** foi inferior ao de Ciências Humanas, registrando uma **acurácia média de 55,8%**. Apesar disso, foi uma das **melhores métricas entre todas as disciplinas avaliadas**, superando, por exemplo, Matemática e Ciências da Natureza.  
@@ -408,7 +487,7 @@ def render(**kwargs):
     
     
     st.markdown("#### 2.5.4 - Ciências da Natureza")
-    show_discipline_metrics(text_table, 'ciencias-natureza')
+    show_discipline_metrics(all_text_models, example_text_questions, 'ciencias-natureza')
     st.markdown("""
                 A disciplina de Ciências da Natureza apresentou um desempenho próximo ao observado em Linguagens, tanto em relação à acurácia quanto ao tempo de inferência. No entanto, ao analisarmos a variação de tempo entre os modelos testados, nota-se que a escala de crescimento do tempo de inferência foi exponencialmente inferior à observada em Matemática, sugerindo que a complexidade das questões não gerou um impacto tão significativo no processamento dos modelos. Em termos médios, os modelos levaram aproximadamente dez segundos a mais para responder às questões dessa disciplina quando comparados a Linguagens, enquanto a acurácia média se mostrou apenas um ponto percentual superior.  
 
@@ -428,14 +507,11 @@ def render(**kwargs):
                 A análise desse histograma revela um comportamento que **se aproxima de uma distribuição normal**, com maior concentração de frequência na região central da curva e menor nas extremidades. No entanto, nota-se uma assimetria pontual, especialmente na **categoria de acertos igual a 4**, que apresentou uma frequência superior à categoria seguinte, o que indica uma leve irregularidade na distribuição dos acertos.  
                 """)
     
-    table_question = utils.analisar_tabela(text_table, 'question')
-    table_question = table_question[table_question['Total'] > 10]
-    
-    st.pyplot(plots.histogram(table_question, 'OK', 100))
+    show_question_histogram(all_text_models, example_text_questions, 'OK', 100)
     
     st.markdown("Por outro lado, ao analisarmos a distribuição do tempo médio de inferência por questão, observamos um padrão **exponencial**, no qual os tempos mais baixos representam a maior parte da distribuição. A mediana situa-se em **5,4 segundos**, com a média em **9,3 segundos** e o terceiro quartil em **10,66 segundos**, enquanto o tempo máximo registrado foi de **45 segundos**. Esse comportamento sugere que, na maioria dos casos, os modelos conseguem responder rapidamente às questões, exceto em algumas exceções nas quais o tempo de inferência se eleva consideravelmente. Como analisado anteriormente, essas exceções ocorrem com maior frequência em **questões matemáticas**, que exigem processamento adicional, podendo resultar em tempos significativamente mais elevados.")
     
-    st.pyplot(plots.histogram(table_question, 'Tavg', 4))
+    show_question_histogram(all_text_models, example_text_questions, 'Tavg', 4)
     
     st.markdown("Para ilustrar melhor esses resultados, a seguir apresentamos exemplos das **questões mais fáceis e mais difíceis**, evidenciando os padrões de acerto e tempo de resposta em diferentes tipos de problemas.")
     
@@ -554,4 +630,8 @@ def render(**kwargs):
                 Diante desses resultados, podemos concluir que **a escolha do modelo ideal deve levar em consideração múltiplos fatores além da acurácia bruta**, incluindo **tempo de inferência, consumo computacional, estabilidade das respostas e adequação às tarefas específicas**. Modelos robustos podem ser necessários para cenários que demandam **maior precisão**, mas modelos intermediários demonstraram **eficiência suficiente** para grande parte das tarefas. Além disso, a dificuldade que os modelos enfrentaram com **questões matemáticas** reforça a necessidade de avanços na capacidade de raciocínio lógico das arquiteturas atuais.  
 
                 Por fim, a análise apresentada destaca **os desafios e limitações das arquiteturas de LLMs atuais**, ao mesmo tempo que aponta caminhos para otimizações futuras, seja na **especialização de modelos para tarefas específicas**, seja no aprimoramento do **balanço entre custo computacional e desempenho**.  
-                """)
\ No newline at end of file
+                """)
+
+
+if __name__ == "__main__":
+    print(prewarm_figures())
@@ -1,10 +1,29 @@
-import base64
+import os
 from lib.models_help.habilities import dict_assuntos, dict_habilidades
+from lib.models_help.images import image_cache
 from typing import Literal
 
+# Ordem das partes do prompt de resolução:
+# - question-first: contexto e alternativas primeiro e as instruções fixas no fim (formato original)
+# - instructions-first: as instruções fixas primeiro, formando um prefixo idêntico entre as questões que o
+#   Ollama reaproveita do cache KV enquanto o modelo continua carregado
+PROMPT_LAYOUTS = ('question-first', 'instructions-first')
+PROMPT_LAYOUT = os.getenv('ESTUDA_PROMPT_LAYOUT', 'question-first')
+
+INSTRUCTIONS_PREFIX = """
+    You will receive a multiple-choice question followed by its alternatives (A), (B), (C), (D) and (E).
+    Select only one correct alternative, and answer only the text of the question.
+    
+    Answer only with the correct letter inside the parentheses ()
+    If alternative (A) is correct, answer: (A)
+    If alternative (B) is correct, answer: (B)
+    ...
+    If alternative (E) is correct, answer: (E)
+    """
+
 def codefy_image(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
+    # Cada imagem é lida e codificada uma única vez, mesmo entre modelos diferentes
+    return image_cache.get(image_path)
 
 def get_images(question):
     match(question.get('type')):
@@ -19,18 +38,46 @@ def get_images(question):
         case _:
             return None
         
-def text_question(question):
+def check_layout(layout):
+    layout = layout or PROMPT_LAYOUT
+    if layout not in PROMPT_LAYOUTS:
+        raise ValueError(f"Layout de prompt inválido: {layout}. Use um de {PROMPT_LAYOUTS}.")
+    return layout
+
+def apply_layout(body, layout=None):
+    """Aplica o layout ao texto da questão (contexto e alternativas)."""
+    return INSTRUCTIONS_PREFIX + body if check_layout(layout) == 'instructions-first' else body
+
+def alternatives_prompt(question, layout=None, descriptions=None):
+    """Alternativas da questão (com as descrições das imagens, se houver); no layout instructions-first sem as instruções."""
+    if check_layout(layout) == 'instructions-first':
+        return options_list(question, descriptions)
+    return questions_description(question, descriptions) if descriptions else questions_options(question)
+
+def text_question(question, layout=None):
+    options = alternatives_prompt(question, layout)
     match(question.get('type')):
         case 'answer-image':
-            return context_prompt(question, False) + questions_options(question) + answer_images_description(1)
+            body = context_prompt(question, False) + options + answer_images_description(1)
         case 'only-text':
-            return context_prompt(question, False) + questions_options(question)
+            body = context_prompt(question, False) + options
         case 'context-image':
-            return context_prompt(question, True) + questions_options(question)
+            body = context_prompt(question, True) + options
         case 'full-image':
-            return context_prompt(question, True) + questions_options(question) + answer_images_description(2)
+            body = context_prompt(question, True) + options + answer_images_description(2)
         case _:
-            return context_prompt(question, False) + questions_options(question)
+            body = context_prompt(question, False) + options
+    return apply_layout(body, layout)
+
+def options_list(question, descriptions=None):
+    """Apenas as alternativas, para o layout em que as instruções ficam no início do prompt."""
+    alternatives = []
+    for i, letter in enumerate(['A', 'B', 'C', 'D', 'E']):
+        alternative = f"    ({letter}): {question[letter]}"
+        if descriptions:
+            alternative += f"\n    ({letter}) Description:\n    {descriptions[i]}\n"
+        alternatives.append(alternative)
+    return "\n    Alternatives:\n" + "\n".join(alternatives) + "\n    "
 
 def questions_options(question):
     return f"""
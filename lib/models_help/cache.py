@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+RESPONSE_CACHE_FILE = "./data/cache/responses.sqlite"
+
+class ResponseCache:
+    """Cache opcional das respostas dos modelos, indexado pelo hash da requisição completa.
+
+    As respostas ficam em um SQLite local; quando o total passa de `max_bytes`, as entradas
+    acessadas há mais tempo são removidas. Requisições amostradas (temperatura maior que zero ou não
+    informada, já que Ollama e Gemini amostram por padrão) não são cacheadas, a não ser que
+    `cache_sampled` seja verdadeiro. Os perfis de resolva, habilidades e assuntos usam temperatura 0.
+
+    Variáveis de ambiente da instância `response_cache`: ESTUDA_RESPONSE_CACHE=1 liga o cache,
+    ESTUDA_RESPONSE_CACHE_SAMPLED=1 cacheia também as requisições amostradas e ESTUDA_RESPONSE_CACHE_MB
+    limita o tamanho.
+    """
+
+    def __init__(self, filename=RESPONSE_CACHE_FILE, max_bytes=512 * 2**20, enabled=False, cache_sampled=False):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.cache_sampled = cache_sampled
+        self.connection = None
+        self.lock = threading.Lock()
+        self.stats = {'hits' : 0, 'misses' : 0, 'bypass' : 0, 'evictions' : 0}
+
+    def connect(self):
+        if self.connection is None:
+            os.makedirs(os.path.dirname(self.filename) or '.', exist_ok=True)
+            self.connection = sqlite3.connect(self.filename, check_same_thread=False)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT, size INTEGER, accessed REAL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        return self.connection
+
+    @staticmethod
+    def key(model, prompt, images=None, options=None) -> str:
+        # As imagens entram no hash pelo seu próprio hash, para não serializar megabytes de base64
+        images_hash = [hashlib.sha256(image.encode("utf-8")).hexdigest() for image in images or []]
+        request = json.dumps([model, prompt, images_hash, options or {}], sort_keys=True, default=str)
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            connection = self.connect()
+            row = connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+                connection.commit()
+        return row[0] if row is not None else None
+
+    def put(self, key, response):
+        with self.lock:
+            connection = self.connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, response, len(response.encode("utf-8")), time.time())
+            )
+            self.evict(connection)
+            connection.commit()
+
+    def evict(self, connection):
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        while total > self.max_bytes:
+            row = connection.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 1").fetchone()
+            if row is None:
+                break
+            connection.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+            total -= row[1]
+            self.stats['evictions'] += 1
+
+    def fetch(self, model, prompt, images, options, generate, bypass=False):
+        """Retorna a resposta cacheada ou chama `generate()` e guarda o resultado."""
+        temperature = (options or {}).get('temperature')
+        sampled = temperature is None or temperature > 0
+        if not self.enabled or bypass or (sampled and not self.cache_sampled):
+            self.stats['bypass'] += 1
+            return generate()
+
+        key = self.key(model, prompt, images, options)
+        if (response := self.get(key)) is not None:
+            self.stats['hits'] += 1
+            return response
+
+        self.stats['misses'] += 1
+        response = generate()
+        if isinstance(response, str):
+            self.put(key, response)
+        return response
+
+    def hit_rate(self):
+        return self.stats['hits'] / max(1, self.stats['hits'] + self.stats['misses'])
+
+    def clear(self):
+        with self.lock:
+            self.connect().execute("DELETE FROM responses")
+            self.connection.commit()
+
+
+response_cache = ResponseCache(
+    max_bytes=int(os.getenv('ESTUDA_RESPONSE_CACHE_MB', 512)) * 2**20,
+    enabled=os.getenv('ESTUDA_RESPONSE_CACHE', '0') == '1',
+    cache_sampled=os.getenv('ESTUDA_RESPONSE_CACHE_SAMPLED', '0') == '1'
+)
@@ -0,0 +1,352 @@
+import abc
+import base64
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from lib.utils import load_json, append_json, compact_json, journal_path
+from lib.utils.tokens import count_tokens, truncate_tokens, IMAGE_TOKENS
+
+# Orçamento de tokens de entrada de cada requisição do chat
+CHAT_TOKEN_BUDGET = int(os.getenv('ESTUDA_CHAT_TOKEN_BUDGET', 8000))
+
+# Tamanho máximo do resumo das mensagens que saíram da janela
+SUMMARY_TOKEN_BUDGET = int(os.getenv('ESTUDA_CHAT_SUMMARY_TOKENS', 600))
+
+# Quanto de cada mensagem antiga entra no resumo
+TURN_SUMMARY_TOKENS = 80
+
+SPEAKERS = {'user' : 'Aluno', 'model' : 'Tutor'}
+
+CHATS_FILE = "./data/chats.json"
+
+def part_tokens(part) -> int:
+    if isinstance(part, str):
+        return count_tokens(part)
+    if 'inline_data' in part or 'file_data' in part:
+        return IMAGE_TOKENS
+    return count_tokens(part.get('text'))
+
+def message_tokens(message) -> int:
+    return sum(part_tokens(part) for part in message['parts'])
+
+def payload_bytes(contents) -> int:
+    """Tamanho aproximado, em bytes, do conteúdo enviado em uma requisição."""
+    return len(json.dumps(contents, ensure_ascii=False).encode('utf-8'))
+
+def message_text(message) -> str:
+    return " ".join(part if isinstance(part, str) else part.get('text', '') for part in message['parts'])
+
+
+class ChatContext:
+    """Janela de contexto de um chat com orçamento de tokens.
+
+    A primeira mensagem (as partes da questão) fica sempre fixa. Quando a conversa passa do orçamento,
+    as mensagens mais antigas saem da janela e entram, resumidas, em um texto anexado à questão.
+    O resumo é incremental: cada mensagem é resumida uma única vez, quando sai da janela.
+    """
+
+    def __init__(self, budget=CHAT_TOKEN_BUDGET, summary_budget=SUMMARY_TOKEN_BUDGET):
+        self.budget = budget
+        self.summary_budget = summary_budget
+        self.tokens: list[int] = []
+        self.summary_lines: list[str] = []
+        self.summary_tokens = 0
+        self.start = 1
+        self.requests: list[dict] = []
+
+    def state(self) -> dict:
+        return dict(vars(self))
+
+    @classmethod
+    def from_state(cls, state: dict) -> "ChatContext":
+        context = cls()
+        vars(context).update(state)
+        return context
+
+    def count(self, messages):
+        """Conta os tokens apenas das mensagens novas."""
+        for message in messages[len(self.tokens):]:
+            self.tokens.append(message_tokens(message))
+
+    @property
+    def summary(self) -> str:
+        if not self.summary_lines:
+            return ""
+        return "Resumo da conversa anterior:\n" + "\n".join(self.summary_lines)
+
+    def fold(self, message):
+        """Adiciona a mensagem ao resumo, descartando as linhas mais antigas se o resumo passar do limite."""
+        text = truncate_tokens(message_text(message), TURN_SUMMARY_TOKENS)
+        self.summary_lines.append(f"{SPEAKERS.get(message['role'], message['role'])}: {text}")
+        while len(self.summary_lines) > 1 and count_tokens(self.summary) > self.summary_budget:
+            self.summary_lines.pop(0)
+        self.summary_tokens = count_tokens(self.summary)
+
+    def build(self, messages) -> tuple[list[dict], dict]:
+        """Monta o conteúdo da requisição dentro do orçamento e retorna também a contagem de tokens."""
+        self.count(messages)
+        available = self.budget - self.tokens[0]
+
+        # A última mensagem (pergunta atual) é sempre enviada; a janela começa sempre em uma mensagem do aluno
+        while self.start < len(messages) - 1 and (
+            sum(self.tokens[self.start:]) + self.summary_tokens > available or messages[self.start]['role'] != 'user'
+        ):
+            self.fold(messages[self.start])
+            self.start += 1
+
+        pinned = messages[0]
+        if self.summary_lines:
+            pinned = {'role' : pinned['role'], 'parts' : [*pinned['parts'], {'text' : self.summary}]}
+
+        stats = {
+            'tokens' : self.tokens[0] + self.summary_tokens + sum(self.tokens[self.start:]),
+            'pinned' : self.tokens[0],
+            'summary' : self.summary_tokens,
+            'messages' : len(messages) - self.start,
+            'summarized' : self.start - 1,
+        }
+        contents = [pinned, *messages[self.start:]]
+        stats['bytes'] = payload_bytes(contents)
+        self.requests.append(stats)
+        return contents, stats
+
+
+class ContextStore(abc.ABC):
+    """Contexto fixo das questões enviado uma única vez por sessão.
+
+    Os chats guardam sempre as imagens inline; a cada requisição `prepare` troca as imagens da mensagem fixa
+    pelas referências (`file_data`) já enviadas ao provedor, como no cache de contexto dos provedores, fazendo
+    o upload só na primeira vez. Assim um chat restaurado do disco ou aberto em outra sessão (com outro
+    armazenamento) continua válido. As referências expiram depois de `ttl` segundos e são reenviadas.
+    """
+
+    ttl: float | None = None
+
+    def __init__(self):
+        self.handles: dict[str, tuple[str, float]] = {}
+        self.stats = {'uploads' : 0, 'uploaded_bytes' : 0, 'reused' : 0, 'errors' : 0}
+
+    @abc.abstractmethod
+    def upload(self, key, data: bytes, mime_type) -> str:
+        """Envia os bytes ao provedor e retorna a URI que os referencia."""
+
+    def resolve(self, contents) -> list[dict]:
+        """Conteúdo como deve ser enviado ao provedor; as URIs do upload já são válidas para ele."""
+        return contents
+
+    def uri(self, key, inline) -> str:
+        """URI da imagem, reaproveitando o upload enquanto ele não expira."""
+        if (handle := self.handles.get(key)) is not None:
+            uri, uploaded_at = handle
+            if self.ttl is None or time.time() - uploaded_at < self.ttl:
+                self.stats['reused'] += 1
+                return uri
+        data = base64.b64decode(inline['data'])
+        uri = self.upload(key, data, inline['mime_type'])
+        self.handles[key] = (uri, time.time())
+        self.stats['uploads'] += 1
+        self.stats['uploaded_bytes'] += len(data)
+        return uri
+
+    def attach(self, key, parts) -> list:
+        """Troca as imagens inline pelas referências enviadas ao provedor."""
+        attached = []
+        for i, part in enumerate(parts):
+            if isinstance(part, dict) and 'inline_data' in part:
+                inline = part['inline_data']
+                try:
+                    part = {'file_data' : {'mime_type' : inline['mime_type'], 'file_uri' : self.uri(f"{key}-{i}", inline)}}
+                except Exception:
+                    # Sem o upload, a imagem continua sendo enviada inline
+                    self.stats['errors'] += 1
+            attached.append(part)
+        return attached
+
+    def prepare(self, key, contents) -> list[dict]:
+        """Conteúdo da requisição com as imagens da mensagem fixa (a primeira) referenciadas."""
+        pinned, *rest = contents
+        return self.resolve([{'role' : pinned['role'], 'parts' : self.attach(key, pinned['parts'])}, *rest])
+
+
+class GeminiContextStore(ContextStore):
+    """Upload pela File API do Gemini (os arquivos ficam disponíveis por 48 horas; reenviamos antes disso)."""
+
+    ttl = 47 * 3600
+
+    def upload(self, key, data, mime_type):
+        import google.generativeai as genai
+        file = genai.upload_file(io.BytesIO(data), mime_type=mime_type, display_name=str(key))
+        return file.uri
+
+
+class LocalContextStore(ContextStore):
+    """Substituto local para testes: guarda os bytes em memória e, no envio, as referências `local://`
+    voltam a ser imagens inline (o provedor não as conhece)."""
+
+    def __init__(self):
+        super().__init__()
+        self.blobs: dict[str, tuple[bytes, str]] = {}
+
+    def upload(self, key, data, mime_type):
+        uri = f"local://{hashlib.sha1(data).hexdigest()}"
+        self.blobs[uri] = (data, mime_type)
+        return uri
+
+    def resolve(self, contents) -> list[dict]:
+        """Expande as referências de volta para imagens inline."""
+        def expand(part):
+            if isinstance(part, dict) and 'file_data' in part:
+                data, mime_type = self.blobs[part['file_data']['file_uri']]
+                return {'inline_data' : {'mime_type' : mime_type, 'data' : base64.b64encode(data).decode('utf-8')}}
+            return part
+        return [{'role' : message['role'], 'parts' : [expand(part) for part in message['parts']]} for message in contents]
+
+
+CONTEXT_STORES = {
+    'gemini' : GeminiContextStore,
+    'local' : LocalContextStore,
+}
+
+def get_context_store(kind=None) -> ContextStore:
+    """Cria o armazenamento de contexto configurado em ESTUDA_CHAT_CONTEXT (gemini ou local)."""
+    return CONTEXT_STORES[kind or os.getenv('ESTUDA_CHAT_CONTEXT', 'gemini')]()
+
+
+class ChatSessions:
+    """Chats abertos de todas as sessões, com limite de memória por sessão e global.
+
+    Cada chat (mensagens + estado da janela de contexto) é indexado por (chave do aluno, questão); a chave
+    precisa sobreviver à sessão do Streamlit (ex.: um id guardado na URL) para que o chat possa ser recuperado
+    depois. Ao passar de um dos limites, os chats usados há mais tempo são gravados no journal do `filename` e
+    saem da memória; um índice em memória das chaves gravadas evita ler o arquivo para chats que não existem.
+    Quando o journal passa de `compact_bytes`, ele é incorporado ao snapshot.
+    """
+
+    def __init__(self, filename=CHATS_FILE, max_bytes=256 * 2**20, max_session_bytes=16 * 2**20, compact_bytes=32 * 2**20):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.max_session_bytes = max_session_bytes
+        self.compact_bytes = compact_bytes
+        self.entries: OrderedDict[tuple, dict] = OrderedDict()
+        self.sizes: dict[tuple, int] = {}
+        self.session_sizes: dict[str, int] = {}
+        self.size = 0
+        self.spilled: set[str] | None = None
+        self.lock = threading.RLock()
+        self.stats = {'hits' : 0, 'restores' : 0, 'evictions' : 0, 'compactions' : 0}
+
+    @staticmethod
+    def spill_key(key) -> str:
+        return f"{key[0]}-{key[1]}"
+
+    def spilled_keys(self) -> set[str]:
+        """Chaves já gravadas no arquivo, lidas uma única vez."""
+        if self.spilled is None:
+            self.spilled = set(load_json(self.filename, pass_error=True))
+        return self.spilled
+
+    def get(self, session_id, question_id) -> dict | None:
+        """Chat da questão, restaurando do arquivo se ele tiver sido removido da memória."""
+        key = (session_id, question_id)
+        with self.lock:
+            if (chat := self.entries.get(key)) is not None:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return chat
+
+            if self.spill_key(key) not in self.spilled_keys():
+                return None
+            spilled = load_json(self.filename, pass_error=True)
+            if (state := spilled.get(self.spill_key(key))) is None:
+                return None
+            self.stats['restores'] += 1
+            chat = {
+                'system_instruction' : state['system_instruction'],
+                'messages' : state['messages'],
+                'context' : ChatContext.from_state(state['context']),
+            }
+            return self.put(session_id, question_id, chat)
+
+    def put(self, session_id, question_id, chat: dict) -> dict:
+        self.update(session_id, question_id, chat)
+        return chat
+
+    def update(self, session_id, question_id, chat: dict | None = None):
+        """Recalcula o tamanho do chat (após novas mensagens) e aplica os limites de memória.
+
+        Se o chat for informado ele é (re)inserido, de modo que as mensagens novas não se percam caso ele
+        tenha sido gravado em disco por outra sessão enquanto a resposta era gerada.
+        """
+        key = (session_id, question_id)
+        with self.lock:
+            if chat is not None:
+                self.entries[key] = chat
+            elif key not in self.entries:
+                return
+            self.entries.move_to_end(key)
+            size = payload_bytes(self.entries[key]['messages'])
+            delta = size - self.sizes.get(key, 0)
+            self.sizes[key] = size
+            self.session_sizes[session_id] = self.session_sizes.get(session_id, 0) + delta
+            self.size += delta
+
+            # Remove os chats usados há mais tempo da sessão e depois de todas as sessões; o chat atual nunca sai
+            for old in [k for k in self.entries if k[0] == session_id and k != key]:
+                if self.session_sizes[session_id] <= self.max_session_bytes:
+                    break
+                self.evict(old)
+            for old in [k for k in self.entries if k != key]:
+                if self.size <= self.max_bytes:
+                    break
+                self.evict(old)
+
+    def evict(self, key):
+        chat = self.entries.pop(key)
+        state = {
+            'system_instruction' : chat['system_instruction'],
+            'messages' : chat['messages'],
+            'context' : chat['context'].state(),
+        }
+        append_json({self.spill_key(key) : state}, self.filename)
+        self.spilled_keys().add(self.spill_key(key))
+        size = self.sizes.pop(key)
+        self.session_sizes[key[0]] -= size
+        if self.session_sizes[key[0]] == 0:
+            del self.session_sizes[key[0]]
+        self.size -= size
+        self.stats['evictions'] += 1
+
+        if os.path.exists(journal := journal_path(self.filename)) and os.path.getsize(journal) >= self.compact_bytes:
+            self.compact()
+
+    def usage(self, session_id=None) -> dict:
+        """Uso de memória (bytes) global e da sessão, para monitoramento."""
+        with self.lock:
+            usage = {
+                'bytes' : self.size,
+                'max_bytes' : self.max_bytes,
+                'chats' : len(self.entries),
+                'sessions' : len(self.session_sizes),
+                'spilled' : len(self.spilled_keys()),
+                **self.stats,
+            }
+            if session_id is not None:
+                usage['session_bytes'] = self.session_sizes.get(session_id, 0)
+                usage['session_chats'] = sum(1 for k in self.entries if k[0] == session_id)
+            return usage
+
+    def compact(self):
+        with self.lock:
+            if compact_json(self.filename):
+                self.stats['compactions'] += 1
+
+
+chat_sessions = ChatSessions(
+    max_bytes=int(os.getenv('ESTUDA_CHAT_MEMORY_MB', 256)) * 2**20,
+    max_session_bytes=int(os.getenv('ESTUDA_CHAT_SESSION_MB', 16)) * 2**20,
+    compact_bytes=int(os.getenv('ESTUDA_CHAT_COMPACT_MB', 32)) * 2**20
+)
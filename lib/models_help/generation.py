@@ -0,0 +1,221 @@
+import re
+import time
+from dataclasses import dataclass, asdict
+from lib.utils.tokens import count_tokens, estimate_request_tokens
+
+# Mesmo padrão usado pelo extract_answer
+ANSWER_PATTERN = re.compile(r'\([ABCDE]\)|\{[ABCDE]\}')
+
+THINK_START = "<think>"
+THINK_END = "</think>"
+
+
+@dataclass(frozen=True)
+class GenerationProfile:
+    """Limites de geração de uma tarefa, aplicados da mesma forma pelos três runners.
+
+    temperature: None mantém o padrão do provedor (amostragem); 0 torna a resposta determinística e cacheável.
+    """
+    max_tokens: int
+    stop: tuple = ()
+    temperature: float | None = None
+
+
+# Perfis por tarefa do build.get_messages, mais a descrição de imagens feita pelo modelo de visão. As tarefas com
+# uma única resposta certa são determinísticas; as explicações e descrições continuam amostradas
+GENERATION_PROFILES = {
+    'resolva' : GenerationProfile(max_tokens=1024, temperature=0.0),
+    'explique' : GenerationProfile(max_tokens=1024),
+    'habilidades' : GenerationProfile(max_tokens=64, stop=("\n\n",), temperature=0.0),
+    'assuntos' : GenerationProfile(max_tokens=96, stop=("\n\n",), temperature=0.0),
+    'descreva' : GenerationProfile(max_tokens=512),
+}
+
+# Janelas de contexto usadas no Ollama: poucos tamanhos fixos evitam recarregar o modelo a cada requisição
+CONTEXT_SIZES = (2048, 4096, 8192, 16384, 32768)
+
+# Folga para a diferença entre a estimativa de tokens e o tokenizer do modelo
+CONTEXT_MARGIN = 1.2
+
+def context_size(prompt, images, max_tokens) -> int:
+    """Menor janela de contexto que comporta o prompt (com as imagens) e a resposta."""
+    needed = estimate_request_tokens(prompt, images) * CONTEXT_MARGIN + max_tokens
+    return next((size for size in CONTEXT_SIZES if size >= needed), CONTEXT_SIZES[-1])
+
+def generation_options(task, prompt, images=None) -> dict:
+    """Opções de geração genéricas da tarefa; cada runner as traduz para os parâmetros do provedor."""
+    profile = GENERATION_PROFILES[task]
+    options = {
+        'max_tokens' : profile.max_tokens,
+        'num_ctx' : context_size(prompt, images, profile.max_tokens),
+    }
+    if profile.stop:
+        options['stop'] = list(profile.stop)
+    if profile.temperature is not None:
+        options['temperature'] = profile.temperature
+    return options
+
+
+class Generation(str):
+    """Texto gerado pelo modelo, com as métricas da geração em `stats` (tokens, parada antecipada, ...).
+
+    Por ser uma str, pode ser usado em qualquer lugar que já recebia a resposta em texto.
+    """
+
+    def __new__(cls, text, **stats):
+        generation = super().__new__(cls, text or "")
+        generation.stats = stats
+        return generation
+
+    def __reduce__(self):
+        return (self.__class__, (str(self),), {'stats' : self.stats})
+
+
+def generation_stats(response) -> dict:
+    """Métricas da geração (vazio para respostas vindas do cache, que são texto puro)."""
+    return getattr(response, 'stats', {})
+
+
+# Expressões que anunciam a resposta final. Sem elas, uma letra citada no meio do raciocínio ("a opção (B)
+# parece correta, porém...") pararia a geração antes da resposta que o extract_answer (a última letra) usaria
+ANSWER_MARKERS = (
+    "resposta", "alternativa correta", "alternativa certa", "opção correta", "letra", "gabarito",
+    "answer", "correct option", "correct alternative",
+)
+
+@dataclass(frozen=True)
+class EarlyStopRules:
+    """Regras para considerar uma resposta final e interromper a geração.
+
+    skip_thinking: ignora o que estiver dentro de <think>...</think> (modelos de reasoning).
+    markers: a letra só vale se um dos marcadores aparecer pouco antes dela (vazio: qualquer letra vale).
+    leading: aceita também a letra no início da resposta, sem marcador (o formato pedido no prompt).
+    grace_chars: quantos caracteres esperar depois da letra antes de parar.
+    reject_listing: descarta "(A): ..." (o modelo repetindo as alternativas, como no prompt).
+    """
+    skip_thinking: bool = True
+    markers: tuple = ANSWER_MARKERS
+    leading: bool = True
+    grace_chars: int = 2
+    reject_listing: bool = True
+    marker_window: int = 80
+
+    def key(self) -> dict:
+        return asdict(self)
+
+
+class AnswerDetector:
+    """Detector incremental da letra final no fluxo de tokens."""
+
+    def __init__(self, rules: EarlyStopRules):
+        self.rules = rules
+        self.text = ""
+        self.scanned = 0
+        self.answer = None
+        self.answer_end = None
+
+    def visible_start(self):
+        """Posição a partir da qual o texto é a resposta (depois do bloco de raciocínio), ou None se ele não acabou."""
+        if not self.rules.skip_thinking or THINK_START not in self.text:
+            return 0
+        end = self.text.rfind(THINK_END)
+        return None if end < 0 else end + len(THINK_END)
+
+    def feed(self, chunk) -> bool:
+        """Acrescenta um pedaço da geração e retorna True quando a geração pode parar."""
+        self.text += chunk or ""
+        if (start := self.visible_start()) is None:
+            return False
+
+        # Reexamina o fim do trecho anterior para pegar padrões quebrados entre chunks. Uma letra só é
+        # decidida quando já chegaram `grace_chars` caracteres depois dela (ex.: "(A)" seguido de ": ...");
+        # até lá o exame recomeça nela no próximo chunk.
+        pending = None
+        for match in ANSWER_PATTERN.finditer(self.text, max(start, self.scanned - 2)):
+            if len(self.text) - match.end() < self.rules.grace_chars:
+                pending = match.start()
+                break
+            if self.accept(match, start):
+                self.answer, self.answer_end = match.group()[1], match.end()
+        self.scanned = len(self.text) if pending is None else pending + 2
+
+        return self.answer is not None and pending is None
+
+    def accept(self, match, start) -> bool:
+        following = self.text[match.end():match.end() + self.rules.grace_chars]
+        if self.rules.reject_listing and following.lstrip().startswith(":"):
+            return False
+        if self.rules.leading and not self.text[start:match.start()].strip():
+            return True
+        if self.rules.markers:
+            window = self.text[max(start, match.start() - self.rules.marker_window):match.start()].lower()
+            return any(marker.lower() in window for marker in self.rules.markers)
+        return True
+
+
+# Média de tokens das gerações completas por modelo, usada para estimar o tempo economizado
+_completion_tokens: dict[str, tuple[int, float]] = {}
+
+def record_completion(model, tokens):
+    if not tokens:
+        return
+    count, mean = _completion_tokens.get(model, (0, 0.0))
+    _completion_tokens[model] = (count + 1, mean + (tokens - mean) / (count + 1))
+
+def seed_completions(predictions):
+    """Alimenta as médias com as predições já salvas que foram geradas até o fim."""
+    for prediction in predictions:
+        if prediction.get('early_stop') is False:
+            record_completion(prediction['model'], prediction.get('tokens'))
+
+def estimate_time_saved(model, tokens, elapsed):
+    """Tempo que a geração levaria até o tamanho médio das respostas completas do modelo, no mesmo ritmo."""
+    if model not in _completion_tokens or tokens <= 0 or elapsed <= 0:
+        return None
+    _, mean = _completion_tokens[model]
+    return max(0.0, mean - tokens) * elapsed / tokens
+
+def usage_source(usage, stopped) -> str:
+    """Origem das contagens e dos tempos de uma geração (ver stream_generation)."""
+    if stopped or 'tokens' not in usage:
+        return 'estimated'
+    return 'backend' if 'eval_time' in usage and 'prompt_eval_time' in usage else 'client'
+
+def stream_generation(model, pieces, rules: EarlyStopRules = None, close=None) -> Generation:
+    """Consome o stream de (texto, uso), parando assim que a resposta final for detectada. Sem `rules` o stream é lido até o fim.
+
+    `uso` é None ou um dict com as contagens do backend (tokens, prompt_tokens, eval_time, prompt_eval_time), em
+    geral presente só nos últimos pedaços. O que o backend não informar (inclusive quando a geração é interrompida
+    antes do fim) é estimado: os tokens pelo tiktoken, o tempo de geração depois do primeiro token e o tempo de
+    processamento do prompt pelo tempo até o primeiro token. `usage_source` diz a origem: 'backend' quando a geração
+    foi até o fim e tanto os tokens quanto os tempos vieram do backend (Ollama); 'client' quando os tokens vieram
+    do backend mas os tempos foram medidos no cliente, incluindo a rede (Gemini e OpenAI); 'estimated' nos demais.
+    """
+    start = time.monotonic()
+    detector = AnswerDetector(rules) if rules is not None else None
+    text, usage, stopped, ttft = "", {}, False, None
+    try:
+        for piece, piece_usage in pieces:
+            if piece and ttft is None:
+                ttft = time.monotonic() - start
+            text += piece or ""
+            usage.update({key : value for key, value in (piece_usage or {}).items() if value is not None})
+            if detector is not None and detector.feed(piece):
+                stopped = True
+                break
+    finally:
+        if close is not None:
+            close()
+
+    elapsed = time.monotonic() - start
+    return Generation(
+        text,
+        tokens=usage.get('tokens') or count_tokens(text),
+        prompt_tokens=usage.get('prompt_tokens'),
+        early_stop=stopped,
+        ttft=ttft,
+        generation_time=elapsed,
+        eval_time=usage.get('eval_time', elapsed - ttft if ttft is not None else None),
+        prompt_eval_time=usage.get('prompt_eval_time', ttft),
+        usage_source=usage_source(usage, stopped),
+    )
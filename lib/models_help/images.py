@@ -0,0 +1,86 @@
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+class ImageCache:
+    """Cache das imagens em base64, indexado por caminho, mtime e tamanho do arquivo.
+
+    A camada em memória é um LRU limitado por `max_bytes`. Se `sidecar_dir` for informado,
+    cada imagem codificada também é salva em disco, de modo que o arquivo original só é lido uma vez.
+    """
+
+    def __init__(self, max_bytes=256 * 2**20, sidecar_dir=None):
+        self.max_bytes = max_bytes
+        self.sidecar_dir = sidecar_dir
+        self.entries: OrderedDict[tuple, str] = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.stats = {'hits' : 0, 'sidecar_hits' : 0, 'misses' : 0, 'evictions' : 0}
+
+    @staticmethod
+    def key(image_path):
+        stat = os.stat(image_path)
+        return (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size)
+
+    def sidecar_path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.sidecar_dir, f"{digest}.b64")
+
+    def load(self, image_path, key):
+        if self.sidecar_dir is not None and os.path.exists(sidecar := self.sidecar_path(key)):
+            self.stats['sidecar_hits'] += 1
+            with open(sidecar, 'r', encoding='ascii') as file:
+                return file.read()
+
+        self.stats['misses'] += 1
+        with open(image_path, "rb") as image_file:
+            encoded = base64.b64encode(image_file.read()).decode("utf-8")
+
+        if self.sidecar_dir is not None:
+            os.makedirs(self.sidecar_dir, exist_ok=True)
+            tmp_sidecar = f"{sidecar}.tmp"
+            with open(tmp_sidecar, 'w', encoding='ascii') as file:
+                file.write(encoded)
+            os.replace(tmp_sidecar, sidecar)
+
+        return encoded
+
+    def get(self, image_path) -> str:
+        key = self.key(image_path)
+        with self.lock:
+            if (encoded := self.entries.get(key)) is not None:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return encoded
+
+        encoded = self.load(image_path, key)
+
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = encoded
+                self.size += len(encoded)
+            # Remove as imagens usadas há mais tempo até caber no limite
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, old = self.entries.popitem(last=False)
+                self.size -= len(old)
+                self.stats['evictions'] += 1
+        return encoded
+
+    def prewarm(self, image_paths):
+        """Codifica antecipadamente uma lista de imagens (útil para gerar os sidecars)."""
+        for image_path in image_paths:
+            if image_path:
+                self.get(image_path)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+image_cache = ImageCache(
+    max_bytes=int(os.getenv('ESTUDA_IMAGE_CACHE_MB', 256)) * 2**20,
+    sidecar_dir=os.getenv('ESTUDA_IMAGE_SIDECAR_DIR')
+)
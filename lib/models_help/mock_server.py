@@ -0,0 +1,346 @@
+"""Servidor local que imita as APIs do Ollama, da OpenAI e do Gemini para testes de carga sem modelos reais.
+
+Uso:
+    python -m lib.models_help.mock_server --port 11434 --latency 2.0 --distribution lognormal --error-rate 0.01
+
+Depois basta apontar os clientes para ele:
+    OLLAMA_HOST=127.0.0.1:11434  OPENAI_BASE_URL=http://127.0.0.1:11434/v1  GEMINI_BASE_URL=http://127.0.0.1:11434
+"""
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+@dataclass
+class MockConfig:
+    latency: float = 0.5                # Latência média até a resposta completa, com ou sem streaming (segundos)
+    latency_std: float = 0.25           # Desvio padrão da latência
+    distribution: str = 'fixed'         # fixed, uniform, normal ou lognormal
+    first_token: float = 0.1            # Tempo até o primeiro pedaço no modo streaming
+    chunk_rate: float = 50.0            # Pedaços (tokens) por segundo no modo streaming
+    prompt_rate: float = 2000.0         # Tokens do prompt fora do cache processados por segundo (Ollama)
+    error_rate: float = 0.0             # Proporção de respostas 500
+    rate_limit_rate: float = 0.0        # Proporção de respostas 429
+    timeout_rate: float = 0.0           # Proporção de requisições que nunca respondem
+    hang: float = 600.0                 # Tempo que uma requisição "travada" fica aberta
+    answers: list[str] = field(default_factory=list)  # Respostas fixas; se vazio, sorteia uma alternativa
+    seed: int | None = None
+
+class MockBackend:
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests' : 0, 'errors' : 0, 'rate_limited' : 0, 'timeouts' : 0, 'cancelled' : 0}
+        self.last_prompts: dict[str, str] = {}
+
+    def uncached(self, model, prompt):
+        """Parte do prompt depois do prefixo em comum com o último prompt do modelo, como no cache KV do Ollama."""
+        with self.lock:
+            cached = len(os.path.commonprefix([self.last_prompts.get(model, ''), prompt]))
+            self.last_prompts[model] = prompt
+        return prompt[cached:]
+
+    def sample_latency(self):
+        c = self.config
+        with self.lock:
+            match(c.distribution):
+                case 'uniform':
+                    value = self.random.uniform(max(0, c.latency - c.latency_std), c.latency + c.latency_std)
+                case 'normal':
+                    value = self.random.gauss(c.latency, c.latency_std)
+                case 'lognormal':
+                    # Parametrizada pela média e desvio desejados
+                    sigma2 = math.log(1 + (c.latency_std / max(c.latency, 1e-9)) ** 2)
+                    mu = math.log(max(c.latency, 1e-9)) - sigma2 / 2
+                    value = self.random.lognormvariate(mu, sigma2 ** 0.5)
+                case _:
+                    value = c.latency
+        return max(0.0, value)
+
+    def fault(self):
+        """Sorteia uma falha a ser injetada: 'timeout', 'rate_limit', 'error' ou None."""
+        c = self.config
+        with self.lock:
+            self.stats['requests'] += 1
+            draw = self.random.random()
+        for kind, counter, rate in (('timeout', 'timeouts', c.timeout_rate), ('rate_limit', 'rate_limited', c.rate_limit_rate), ('error', 'errors', c.error_rate)):
+            if draw < rate:
+                with self.lock:
+                    self.stats[counter] += 1
+                return kind
+            draw -= rate
+        return None
+
+    def answer(self):
+        with self.lock:
+            if self.config.answers:
+                return self.random.choice(self.config.answers)
+            return f"Analisando as alternativas, a resposta correta é ({self.random.choice('ABCDE')})"
+
+    def chunks(self, text):
+        words = text.split(' ')
+        return [word + (' ' if i < len(words) - 1 else '') for i, word in enumerate(words)]
+
+
+def now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    backend: MockBackend = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def start_stream(self, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def write_chunk(self, data: str):
+        raw = data.encode('utf-8')
+        self.wfile.write(f"{len(raw):X}\r\n".encode('ascii') + raw + b"\r\n")
+        self.wfile.flush()
+
+    def end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def inject_fault(self):
+        """Aplica a falha sorteada; retorna True se a requisição já foi respondida."""
+        match(self.backend.fault()):
+            case 'timeout':
+                time.sleep(self.backend.config.hang)
+                self.close_connection = True
+                return True
+            case 'rate_limit':
+                self.send_response(429)
+                self.send_header('Retry-After', '1')
+                self.send_header('Content-Type', 'application/json')
+                body = json.dumps({'error' : {'code' : 429, 'message' : 'Rate limit exceeded', 'status' : 'RESOURCE_EXHAUSTED'}}).encode('utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return True
+            case 'error':
+                self.send_json({'error' : 'mock internal error'}, status=500)
+                return True
+        return False
+
+    def generate(self, stream, emit, finish, prompt_eval=0.0):
+        """Produz a resposta respeitando a latência; `emit` envia cada pedaço e `finish` a resposta final.
+
+        A latência sorteada é o tempo até a resposta completa nos dois modos: no streaming, o primeiro pedaço sai
+        depois de `first_token` e o restante da latência é dividido entre os pedaços, sem passar de `chunk_rate`.
+        `prompt_eval` é o tempo de processamento do prompt, somado antes do primeiro pedaço.
+        """
+        text = self.backend.answer()
+        latency = self.backend.sample_latency()
+        if not stream:
+            time.sleep(prompt_eval + latency)
+            return finish(text, prompt_eval + latency)
+
+        chunks = self.backend.chunks(text)
+        first_token = min(self.backend.config.first_token, latency)
+        interval = max(1 / self.backend.config.chunk_rate, (latency - first_token) / len(chunks))
+        time.sleep(prompt_eval + first_token)
+        for chunk in chunks:
+            try:
+                emit(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                # O cliente encerrou o stream antes do fim (ex.: parada antecipada)
+                with self.backend.lock:
+                    self.backend.stats['cancelled'] += 1
+                self.close_connection = True
+                return
+            time.sleep(interval)
+        return finish(text, prompt_eval + first_token + len(chunks) * interval)
+
+    def ollama_stats(self, prompt, text, elapsed, prompt_eval):
+        # Assim como o Ollama, conta e cronometra apenas os tokens do prompt que não estavam no cache
+        return {
+            'done' : True, 'done_reason' : 'stop', 'total_duration' : int(elapsed * 1e9),
+            'load_duration' : 0, 'prompt_eval_count' : len(prompt.split()), 'prompt_eval_duration' : int(prompt_eval * 1e9),
+            'eval_count' : len(text.split()), 'eval_duration' : int((elapsed - prompt_eval) * 1e9),
+        }
+
+    def do_GET(self):
+        if self.path.startswith('/api/tags'):
+            return self.send_json({'models' : [{
+                'name' : 'mock', 'model' : 'mock', 'modified_at' : now(), 'size' : 0, 'digest' : 'mock',
+                'details' : {'format' : 'gguf', 'family' : 'mock', 'parameter_size' : '0B', 'quantization_level' : 'Q4_0'}
+            }]})
+        if self.path.startswith('/api/version'):
+            return self.send_json({'version' : 'mock'})
+        self.send_json({'error' : 'not found'}, status=404)
+
+    def do_POST(self):
+        try:
+            body = self.read_body()
+        except json.JSONDecodeError:
+            return self.send_json({'error' : 'invalid json'}, status=400)
+
+        if self.path.startswith('/api/show'):
+            return self.send_json({'modelfile' : '', 'parameters' : '', 'template' : '', 'details' : {'family' : 'mock'}})
+
+        if self.inject_fault():
+            return
+
+        if self.path.startswith('/api/generate'):
+            return self.ollama(body, chat=False)
+        if self.path.startswith('/api/chat'):
+            return self.ollama(body, chat=True)
+        if self.path.startswith('/v1/chat/completions'):
+            return self.openai(body)
+        if ':generateContent' in self.path or ':streamGenerateContent' in self.path:
+            return self.gemini(body)
+        self.send_json({'error' : 'not found'}, status=404)
+
+    def ollama(self, body, chat):
+        model = body.get('model', 'mock')
+        prompt = body.get('prompt', '') if not chat else ' '.join(str(m.get('content', '')) for m in body.get('messages', []))
+        prompt = self.backend.uncached(model, prompt)
+        prompt_eval = len(prompt.split()) / self.backend.config.prompt_rate
+        stream = body.get('stream', True)
+
+        def payload(text):
+            return {'message' : {'role' : 'assistant', 'content' : text}} if chat else {'response' : text}
+
+        def emit(chunk):
+            self.write_chunk(json.dumps({'model' : model, 'created_at' : now(), **payload(chunk), 'done' : False}) + "\n")
+
+        def finish(text, elapsed):
+            final = {'model' : model, 'created_at' : now(), **self.ollama_stats(prompt, text, elapsed, prompt_eval)}
+            if stream:
+                self.write_chunk(json.dumps({**final, **payload('')}) + "\n")
+                return self.end_stream()
+            self.send_json({**final, **payload(text), **({} if chat else {'context' : []})})
+
+        if stream:
+            self.start_stream('application/x-ndjson')
+        self.generate(stream, emit, finish, prompt_eval)
+
+    def openai(self, body):
+        model = body.get('model', 'mock')
+        stream = body.get('stream', False)
+        prompt = ' '.join(str(m.get('content', '')) for m in body.get('messages', []))
+        base = {'id' : f"chatcmpl-mock-{time.time_ns()}", 'created' : int(time.time()), 'model' : model}
+
+        def emit(chunk):
+            data = {**base, 'object' : 'chat.completion.chunk',
+                    'choices' : [{'index' : 0, 'delta' : {'role' : 'assistant', 'content' : chunk}, 'finish_reason' : None}]}
+            self.write_chunk(f"data: {json.dumps(data)}\n\n")
+
+        def finish(text, elapsed):
+            usage = {'prompt_tokens' : len(prompt.split()), 'completion_tokens' : len(text.split()),
+                     'total_tokens' : len(prompt.split()) + len(text.split())}
+            if stream:
+                data = {**base, 'object' : 'chat.completion.chunk',
+                        'choices' : [{'index' : 0, 'delta' : {}, 'finish_reason' : 'stop'}], 'usage' : usage}
+                self.write_chunk(f"data: {json.dumps(data)}\n\n")
+                self.write_chunk("data: [DONE]\n\n")
+                return self.end_stream()
+            self.send_json({**base, 'object' : 'chat.completion', 'usage' : usage, 'choices' : [{
+                'index' : 0, 'message' : {'role' : 'assistant', 'content' : text}, 'finish_reason' : 'stop'
+            }]})
+
+        if stream:
+            self.start_stream('text/event-stream')
+        self.generate(stream, emit, finish)
+
+    def gemini(self, body):
+        stream = ':streamGenerateContent' in self.path
+        prompt = ' '.join(
+            part.get('text', '') for content in body.get('contents', []) for part in content.get('parts', [])
+        )
+
+        def candidate(text, finish_reason=None):
+            return {'candidates' : [{'content' : {'role' : 'model', 'parts' : [{'text' : text}]},
+                                     **({'finishReason' : finish_reason} if finish_reason else {})}]}
+
+        def emit(chunk):
+            self.write_chunk(f"data: {json.dumps(candidate(chunk))}\n\n")
+
+        def finish(text, elapsed):
+            usage = {'usageMetadata' : {'promptTokenCount' : len(prompt.split()), 'candidatesTokenCount' : len(text.split()),
+                                        'totalTokenCount' : len(prompt.split()) + len(text.split())}}
+            if stream:
+                self.write_chunk(f"data: {json.dumps({**candidate('', 'STOP'), **usage})}\n\n")
+                return self.end_stream()
+            self.send_json({**candidate(text, 'STOP'), **usage})
+
+        if stream:
+            self.start_stream('text/event-stream')
+        self.generate(stream, emit, finish)
+
+
+def create_server(config: MockConfig = None, host='127.0.0.1', port=0):
+    backend = MockBackend(config or MockConfig())
+    handler = type('BoundMockHandler', (MockHandler,), {'backend' : backend})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server, backend
+
+
+def start_server(config: MockConfig = None, host='127.0.0.1', port=0):
+    """Inicia o servidor em uma thread e retorna (servidor, backend); use `server.server_address` para a porta."""
+    server, backend = create_server(config, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que imita Ollama, OpenAI e Gemini")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--latency', type=float, default=MockConfig.latency)
+    parser.add_argument('--latency-std', type=float, default=MockConfig.latency_std)
+    parser.add_argument('--distribution', choices=['fixed', 'uniform', 'normal', 'lognormal'], default=MockConfig.distribution)
+    parser.add_argument('--first-token', type=float, default=MockConfig.first_token)
+    parser.add_argument('--chunk-rate', type=float, default=MockConfig.chunk_rate)
+    parser.add_argument('--prompt-rate', type=float, default=MockConfig.prompt_rate)
+    parser.add_argument('--error-rate', type=float, default=MockConfig.error_rate)
+    parser.add_argument('--rate-limit-rate', type=float, default=MockConfig.rate_limit_rate)
+    parser.add_argument('--timeout-rate', type=float, default=MockConfig.timeout_rate)
+    parser.add_argument('--hang', type=float, default=MockConfig.hang)
+    parser.add_argument('--answer', action='append', default=[], help="Resposta fixa (pode ser repetido)")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency=args.latency, latency_std=args.latency_std, distribution=args.distribution,
+        first_token=args.first_token, chunk_rate=args.chunk_rate, prompt_rate=args.prompt_rate, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, timeout_rate=args.timeout_rate, hang=args.hang,
+        answers=args.answer, seed=args.seed
+    )
+    server, backend = create_server(config, args.host, args.port)
+    print(f"Servidor de testes em http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(backend.stats)
+
+
+if __name__ == '__main__':
+    main()
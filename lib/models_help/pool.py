@@ -0,0 +1,157 @@
+import atexit
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import CancelledError
+
+# Intervalo usado para verificar se o worker morreu ou se a chamada foi cancelada
+POLL_INTERVAL = 0.5
+
+
+def worker_loop(tasks, results):
+    """Loop executado por cada worker: importa os clientes uma única vez e atende chamadas até receber None."""
+    # Import tardio para evitar import circular com o runner
+    from lib.models_help.runner import get_model_runner
+
+    while (task := tasks.get()) is not None:
+        model, prompt, images, options, submitted = task
+        started = time.time()
+        try:
+            result = get_model_runner(model)(model, prompt, images, **options)
+            # Tempo entre o pedido e o início da chamada (limites de taxa, espera por um worker livre e fila)
+            if hasattr(result, 'stats'):
+                result.stats['queue_wait'] = max(0.0, started - submitted)
+            results.put(result)
+        except Exception as e:
+            results.put(e)
+
+
+class ProviderWorker:
+    """Processo de longa duração que mantém os clientes Ollama/Gemini/OpenAI aquecidos."""
+
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.calls = 0
+        self.start()
+
+    def start(self):
+        self.tasks = self.ctx.Queue()
+        self.results = self.ctx.Queue()
+        self.process = self.ctx.Process(target=worker_loop, args=(self.tasks, self.results), daemon=True)
+        self.process.start()
+
+    def stop(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.tasks.close()
+        self.results.close()
+
+    def recycle(self):
+        """Mata o processo travado e sobe um novo no lugar."""
+        self.stop()
+        self.start()
+
+
+class WorkerPool:
+    """Pool de workers persistentes com timeout, cancelamento e reciclagem por chamada.
+
+    Os workers são criados sob demanda, muitas vezes a partir de threads (modo assíncrono) de um processo com
+    clientes HTTP/gRPC abertos; por isso o padrão é 'spawn', que não copia esse estado como o fork faria.
+    """
+
+    def __init__(self, size=None, start_method=None):
+        self.size = size or int(os.getenv('ESTUDA_POOL_SIZE', 1))
+        self.ctx = multiprocessing.get_context(start_method or os.getenv('ESTUDA_POOL_START_METHOD', 'spawn'))
+        self.workers: list[ProviderWorker] = []
+        self.idle: queue.Queue[ProviderWorker] = queue.Queue()
+        self.lock = threading.Lock()
+        self.recycled = 0
+
+    def acquire(self) -> ProviderWorker:
+        # Cria os workers sob demanda até o limite do pool
+        with self.lock:
+            if self.idle.empty() and len(self.workers) < self.size:
+                worker = ProviderWorker(self.ctx)
+                self.workers.append(worker)
+                return worker
+        return self.idle.get()
+
+    def ensure_size(self, size):
+        """Garante que o pool comporte pelo menos `size` chamadas simultâneas."""
+        with self.lock:
+            self.size = max(self.size, size)
+
+    def release(self, worker: ProviderWorker):
+        self.idle.put(worker)
+
+    def run(self, model, prompt, images=None, timeout=None, cancel: threading.Event = None, options=None, submitted=None):
+        """Executa a chamada em um worker; `submitted` (time.time()) marca o início da espera, se ela começou antes."""
+        submitted = submitted or time.time()
+        worker = self.acquire()
+        try:
+            if not worker.process.is_alive():
+                self.recycle(worker)
+            worker.tasks.put((model, prompt, images, options or {}, submitted))
+            worker.calls += 1
+            deadline = None if timeout is None else time.monotonic() + timeout
+
+            while True:
+                wait = POLL_INTERVAL if deadline is None else min(POLL_INTERVAL, max(0, deadline - time.monotonic()))
+                try:
+                    resultado = worker.results.get(timeout=wait)
+                    break
+                except queue.Empty:
+                    pass
+                except KeyboardInterrupt:
+                    # A resposta em andamento chegaria para a próxima chamada do worker
+                    self.recycle(worker)
+                    raise
+
+                if cancel is not None and cancel.is_set():
+                    self.recycle(worker)
+                    raise CancelledError(f"A geração de resposta do modelo {model} foi cancelada.")
+                if deadline is not None and time.monotonic() >= deadline:
+                    self.recycle(worker)
+                    raise TimeoutError(f"A geração de resposta excedeu o tempo limite de {timeout} segundos.")
+                if not worker.process.is_alive():
+                    self.recycle(worker)
+                    raise RuntimeError(f"O worker do modelo {model} encerrou inesperadamente.")
+        finally:
+            self.release(worker)
+
+        if isinstance(resultado, Exception):
+            raise resultado
+
+        return resultado
+
+    def recycle(self, worker: ProviderWorker):
+        worker.recycle()
+        self.recycled += 1
+
+    def shutdown(self):
+        with self.lock:
+            for worker in self.workers:
+                try:
+                    worker.tasks.put(None)
+                except Exception:
+                    pass
+                worker.stop()
+            self.workers.clear()
+            self.idle = queue.Queue()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(size=None) -> WorkerPool:
+    """Retorna o pool global, criando-o na primeira chamada."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(size)
+            atexit.register(_pool.shutdown)
+        return _pool
@@ -0,0 +1,165 @@
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from lib.utils.tokens import estimate_request_tokens
+
+# Limites padrão por provedor: requisições e tokens por minuto
+DEFAULT_LIMITS = {
+    'gemini' : {'rpm' : 15, 'tpm' : 1_000_000},
+    'openai' : {'rpm' : 500, 'tpm' : 200_000},
+}
+
+class TokenBucket:
+    """Balde de tokens com reposição contínua, expresso em unidades por minuto."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1, deadline=None):
+        """Bloqueia até haver `amount` unidades disponíveis e as consome.
+
+        Com `deadline` (time.monotonic()), levanta TimeoutError se a espera passar do prazo.
+        """
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self.refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            check_deadline(deadline, wait)
+            time.sleep(wait)
+
+    def scale(self, factor, maximum):
+        with self.lock:
+            self.refill()
+            self.rate = min(maximum, max(maximum * 0.05, self.rate * factor))
+            if factor < 1:
+                # Descarta a rajada acumulada após um 429
+                self.tokens = 0
+
+
+def check_deadline(deadline, wait=0.0):
+    """Levanta TimeoutError se esperar mais `wait` segundos passar do prazo."""
+    if deadline is not None and time.monotonic() + wait > deadline:
+        raise TimeoutError("A geração de resposta excedeu o tempo limite enquanto aguardava o limite de requisições do provedor.")
+
+
+def is_rate_limit(error):
+    status = getattr(error, 'status_code', None) or getattr(error, 'code', None)
+    return status == 429 or re.search(r'\b429\b|RESOURCE_EXHAUSTED|rate.?limit', str(error), re.IGNORECASE) is not None
+
+def retry_after(error):
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """Cliente de um provedor remoto com limite de RPM/TPM, backoff adaptativo em 429 e
+    agrupamento de requisições idênticas em andamento."""
+
+    def __init__(self, provider, rpm, tpm, max_retries=6, base_delay=1.0, max_delay=60.0):
+        self.provider = provider
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.in_flight: dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.stats = {'requests' : 0, 'coalesced' : 0, 'rate_limited' : 0, 'tokens' : 0, 'waited' : 0.0}
+
+    def call(self, key, generate, prompt, images=None, deadline=None):
+        """Executa `generate()` respeitando os limites; requisições com a mesma `key` em andamento compartilham o resultado.
+
+        `deadline` (time.monotonic()) é o prazo da chamada: as esperas pelos limites e os novos envios após um 429
+        param nele com TimeoutError, para que a predição seja registrada como timeout.
+        """
+        with self.lock:
+            if (future := self.in_flight.get(key)) is not None:
+                self.stats['coalesced'] += 1
+                owner = False
+            else:
+                future = self.in_flight[key] = Future()
+                owner = True
+
+        if not owner:
+            return future.result(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+        try:
+            future.set_result(self.send(generate, estimate_request_tokens(prompt, images), deadline))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+        return future.result()
+
+    def send(self, generate, tokens, deadline=None):
+        for attempt in range(self.max_retries + 1):
+            start = time.monotonic()
+            self.requests.acquire(deadline=deadline)
+            self.tokens.acquire(tokens, deadline=deadline)
+            self.stats['waited'] += time.monotonic() - start
+            try:
+                response = generate()
+            except Exception as e:
+                if not is_rate_limit(e) or attempt == self.max_retries:
+                    raise
+                # Reduz a taxa e espera antes de tentar novamente
+                self.stats['rate_limited'] += 1
+                self.requests.scale(0.5, self.rpm / 60)
+                delay = (retry_after(e) or min(self.max_delay, self.base_delay * 2 ** attempt)) * random.uniform(0.8, 1.2)
+                check_deadline(deadline, delay)
+                time.sleep(delay)
+                continue
+
+            # Recupera gradualmente a taxa configurada após sucessos
+            self.requests.scale(1.1, self.rpm / 60)
+            self.stats['requests'] += 1
+            self.stats['tokens'] += tokens
+            return response
+
+
+def get_limits(provider):
+    limits = DEFAULT_LIMITS[provider]
+    return (
+        int(os.getenv(f'{provider.upper()}_RPM', limits['rpm'])),
+        int(os.getenv(f'{provider.upper()}_TPM', limits['tpm']))
+    )
+
+rate_limiters = {provider : RateLimiter(provider, *get_limits(provider)) for provider in DEFAULT_LIMITS}
+
+
+def benchmark(limiter, generate, prompts, concurrency=8):
+    """Mede a vazão sustentada (requisições e tokens por minuto) de um limitador contra um endpoint, ex.: o servidor local de testes."""
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda prompt: limiter.call(prompt, lambda: generate(prompt), prompt), prompts))
+    elapsed = time.monotonic() - start
+    return {
+        'requests' : len(results),
+        'seconds' : elapsed,
+        'rpm' : 60 * len(results) / max(elapsed, 1e-9),
+        'tpm' : 60 * sum(estimate_request_tokens(p) for p in prompts) / max(elapsed, 1e-9),
+        **limiter.stats
+    }
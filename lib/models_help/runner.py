@@ -4,7 +4,6 @@ import re
 import time
 from itertools import product
 from IPython.display import clear_output, display
-import multiprocessing
 import warnings
 import tqdm
 import os
@@ -13,12 +12,29 @@ from google import genai
 import openai
 import traceback
 import random
+import asyncio
+import contextlib
+import nest_asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError
 
 # Local Libs
-from lib.utils import (load_json, update_json, test_table, 
+from lib.utils import (load_json, append_json, compact_json, 
                    format_test_table, models_info,
                    load_predictions,gen_modelos_str)
-from lib.models_help.build import text_question, get_images, context_description_prompt, context_description_image, context_prompt, answer_description_image, questions_description, questions_options
+from lib.utils.metrics import MetricsAggregator
+from lib.models_help.pool import get_pool
+from lib.models_help.cache import response_cache
+from lib.models_help.ratelimit import rate_limiters
+from lib.models_help.vision import vision_cache
+from lib.models_help.scheduler import schedule_predictions
+from lib.models_help.generation import (EarlyStopRules, stream_generation, generation_stats, generation_options,
+                                        record_completion, seed_completions, estimate_time_saved)
+from lib.utils.tokens import count_tokens
+from lib.utils.questions import query_questions
+from lib.models_help.build import (text_question, get_images, context_description_prompt, context_description_image, context_prompt,
+                                   answer_description_image, alternatives_prompt, apply_layout, check_layout,
+                                   PROMPT_LAYOUTS)
 
 
 _ = load_dotenv(find_dotenv())
@@ -29,40 +45,84 @@ except:
     client_openai = None
 
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-client_gemini = genai.Client(api_key=GEMINI_API_KEY)
+# GEMINI_BASE_URL permite apontar para um servidor local de testes
+client_gemini = genai.Client(
+    api_key=GEMINI_API_KEY,
+    http_options={'base_url' : os.getenv('GEMINI_BASE_URL')} if os.getenv('GEMINI_BASE_URL') else None
+)
 
-def ollama_generate(model, prompt, images):
-    response = ollama.generate(
-            model=model,
-            prompt=prompt,
-            images=images
+def ollama_options(options):
+    """Traduz as opções genéricas de geração para os parâmetros do Ollama."""
+    options = options or {}
+    translated = {'num_predict' : options.get('max_tokens'), 'num_ctx' : options.get('num_ctx'),
+                  'stop' : options.get('stop'), 'temperature' : options.get('temperature')}
+    return {key : value for key, value in translated.items() if value is not None}
+
+def seconds(nanoseconds):
+    return nanoseconds / 10**9 if nanoseconds is not None else None
+
+def ollama_usage(chunk):
+    """Contagens e durações do Ollama, enviadas apenas no último pedaço do stream."""
+    if not chunk.done:
+        return None
+    return {'tokens' : chunk.eval_count, 'prompt_tokens' : chunk.prompt_eval_count,
+            'eval_time' : seconds(chunk.eval_duration), 'prompt_eval_time' : seconds(chunk.prompt_eval_duration)}
+
+def ollama_generate(model, prompt, images, options=None, early_stop=None):
+    # Sempre em stream: o tempo até o primeiro token é medido igual em todos os provedores
+    stream = ollama.generate(model=model, prompt=prompt, images=images, options=ollama_options(options), stream=True)
+    pieces = ((chunk.response, ollama_usage(chunk)) for chunk in stream)
+    return stream_generation(model, pieces, early_stop, close=stream.close)
+
+def gemini_config(options):
+    """Traduz as opções genéricas de geração para o GenerateContentConfig (o Gemini não tem num_ctx)."""
+    options = options or {}
+    return genai.types.GenerateContentConfig(
+        max_output_tokens=options.get('max_tokens'),
+        stop_sequences=options.get('stop'),
+        temperature=options.get('temperature'),
     )
-    return response.response
 
-def gemini_generate(model, prompt, images):
+def gemini_generate(model, prompt, images, options=None, early_stop=None):
     if images is None:
         images = []
-        
-    response = client_gemini.models.generate_content(
-        model=model,
-        contents = [prompt, *images]
-    )
     
-    return response.text
+    stream = client_gemini.models.generate_content_stream(model=model, contents=[prompt, *images], config=gemini_config(options))
+    pieces = (
+        (chunk.text or "", {'tokens' : chunk.usage_metadata.candidates_token_count,
+                            'prompt_tokens' : chunk.usage_metadata.prompt_token_count} if chunk.usage_metadata else None)
+        for chunk in stream
+    )
+    return stream_generation(model, pieces, early_stop, close=stream.close)
 
-def open_ai(model, prompt, images):
+# Parâmetros fixos enviados à OpenAI; os limites de geração vêm do perfil da tarefa
+OPENAI_OPTIONS = {'temperature' : 0.7}
+
+def openai_options(options):
+    """Traduz as opções genéricas de geração para os parâmetros da OpenAI."""
+    options = options or {}
+    translated = {'max_tokens' : options.get('max_tokens'), 'stop' : options.get('stop'), 'temperature' : options.get('temperature')}
+    return {key : value for key, value in translated.items() if value is not None}
+
+def open_ai(model, prompt, images, options=None, early_stop=None):
     mensagens = [
         {'role': 'system', 'content' : 'Você entende muito de ciências-humanas'},
         {'role' : 'user', 'content' : prompt},
         {'role' : 'assistant', 'content' : 'Responda apenas a alternativa correta dentro dos parênteses, ex: (A)'} # alterar para system o agente
     ]
-    response = client_openai.chat.completions.create(
+    stream = client_openai.chat.completions.create(
         model=model,
         messages=mensagens,
-        max_tokens=10,
-        temperature=0.7
+        stream=True,
+        stream_options={'include_usage' : True},
+        **openai_options(options)
     )
-    return response.choices[0].message.content
+    pieces = (
+        ((chunk.choices[0].delta.content or "") if chunk.choices else "",
+         {'tokens' : chunk.usage.completion_tokens, 'prompt_tokens' : chunk.usage.prompt_tokens} if chunk.usage else None)
+        for chunk in stream
+    )
+    return stream_generation(model, pieces, early_stop, close=stream.close)
     
 def get_model_runner(model):
     if 'gemini' in model:
@@ -72,29 +132,39 @@ def get_model_runner(model):
     return ollama_generate
 
 
-def model_generate(queue, model, prompt, images):
-    try:
-        resposta = get_model_runner(model)(model,prompt,images)
-        queue.put(resposta)
-    except Exception as e:
-        queue.put(e)
-
-def send_text(model, prompt, images=None, timeout=None):
-    queue = multiprocessing.Queue()
-    process = multiprocessing.Process(target=model_generate, args=(queue, model, prompt, images))
-    process.start()
-    process.join(timeout)
-
-    if process.is_alive():
-        process.terminate() 
-        process.join()
-        raise TimeoutError(f"A geração de resposta excedeu o tempo limite de {timeout} segundos.")
-
-    resultado = queue.get()
-    if isinstance(resultado, Exception):
-        raise resultado
+def get_model_options(model, task='resolva', prompt=None, images=None):
+    """Opções de geração da chamada: o perfil da tarefa mais os padrões do provedor para o que o perfil não define."""
+    options = generation_options(task, prompt, images)
+    if 'gpt' in model:
+        options = {**OPENAI_OPTIONS, **options}
+    return options
 
-    return resultado
+def send_text(model, prompt, images=None, timeout=None, early_stop=None, task='resolva', use_cache=True, cancel=None):
+    options = get_model_options(model, task, prompt, images)
+    # As regras de parada antecipada também mudam a resposta, então entram na chave do cache
+    cache_options = options if early_stop is None else {**options, 'early_stop' : early_stop.key()}
+    
+    # O timeout vale para a chamada inteira, incluindo as esperas e novas tentativas do controle de RPM/TPM
+    submitted = time.time()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    
+    def generate():
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            raise TimeoutError(f"A geração de resposta excedeu o tempo limite de {timeout} segundos.")
+        # Os workers são persistentes: o custo de subir processo e clientes é pago uma única vez
+        # `cancel` (threading.Event) interrompe a chamada em andamento e recicla o worker
+        return get_pool().run(model, prompt, images, remaining, cancel=cancel, options={'options' : options, 'early_stop' : early_stop},
+                              submitted=submitted)
+    
+    # Provedores remotos passam pelo controle de RPM/TPM
+    if (limiter := rate_limiters.get(get_provider(model))) is not None:
+        remote_generate = generate
+        key = response_cache.key(model, prompt, images, cache_options)
+        generate = lambda: limiter.call(key, remote_generate, prompt, images, deadline)
+    
+    # Com use_cache=False a geração é sempre refeita (e não é gravada no cache)
+    return response_cache.fetch(model, prompt, images, cache_options, generate, bypass=not use_cache)
 
 
 def extract_answer(texto):
@@ -103,37 +173,288 @@ def extract_answer(texto):
     return occs[-1][1] if occs else None
 
 
-def question_text_vision(model_vision, question, images, timeout):
+def timed(calls, call):
+    """Executa `call()` registrando a duração em `calls` (se informado)."""
+    start = time.perf_counter()
+    try:
+        return call()
+    finally:
+        if calls is not None:
+            calls.append(time.perf_counter() - start)
+
+def question_text_vision(model_vision, question, images, timeout, vision_calls=None, layout=None, use_cache=True, cancel=None):
+    """Monta o texto da questão com as descrições do modelo de visão; a duração de cada descrição vai para `vision_calls`."""
     # Caso a questão possua imagem no contexto
     if question['type'] in ['context-image', 'full-image']:
         context_prompt_str = context_description_image(question) 
-        image_response = send_text(
-            model=model_vision, 
-            prompt=context_prompt_str,
-            images= [images.pop(0)],
-            timeout = timeout
-        )
-        question_text = context_description_prompt(question, image_response.response)
+        context_image = images.pop(0)
+        image_response = timed(vision_calls, lambda: vision_cache.describe(
+            model_vision, question['id'], 'context',
+            lambda: send_text(
+                model=model_vision, 
+                prompt=context_prompt_str,
+                images= [context_image],
+                timeout = timeout,
+                task = 'descreva',
+                use_cache = use_cache,
+                cancel = cancel
+            )
+        ))
+        question_text = context_description_prompt(question, image_response)
     else:
         question_text = context_prompt(question, False)
     # Caso a questão possua imagem nas alternativas
     if question['type'] in ['answer-image', 'full-image']:
         descriptions_list = []
-        for i, ans in enumerate(["A", "B", "C", "D", "E"], start=1):
+        for ans in ["A", "B", "C", "D", "E"]:
             ans_prompt_str = answer_description_image(question, ans)
-            ans_response = ollama.generate(
-                model=model_vision, 
-                prompt=ans_prompt_str,
-                images= [images.pop(0)]
-            )
-            descriptions_list.append(ans_response.response)
-        question_text += "\n" + questions_description(question, descriptions_list)
+            ans_image = images.pop(0)
+            ans_response = timed(vision_calls, lambda: vision_cache.describe(
+                model_vision, question['id'], ans,
+                lambda: send_text(
+                    model=model_vision, 
+                    prompt=ans_prompt_str,
+                    images= [ans_image],
+                    timeout = timeout,
+                    task = 'descreva',
+                    use_cache = use_cache,
+                    cancel = cancel
+                )
+            ))
+            descriptions_list.append(ans_response)
+        question_text += "\n" + alternatives_prompt(question, layout, descriptions_list)
     else:
-        question_text += questions_options(question)
+        question_text += alternatives_prompt(question, layout)
     
-    return question_text
+    return apply_layout(question_text, layout)
+
+# Intervalo mínimo, em segundos, entre duas renderizações da tabela de progresso
+REFRESH_INTERVAL = 2.0
 
-def test_models(questions, primary_models, secundary_models=None, predict_file=None, timeout=None, shuffle=False):    
+class LiveTable:
+    """Tabela de progresso do test_models, atualizada em memória e redesenhada com limite de frequência."""
+    
+    def __init__(self, questions_str, table_models, predict_data, interval=REFRESH_INTERVAL):
+        self.total_questions = len(questions_str)
+        self.interval = interval
+        self.last_render = 0
+        
+        # Considera apenas as predições já existentes das questões e modelos do teste
+        keys = set(gen_modelos_str(table_models, questions_str))
+        self.aggregator = MetricsAggregator(table_models, self.total_questions).update(
+            prediction for key, prediction in predict_data.items() if key in keys
+        )
+    
+    def add(self, prediction):
+        self.aggregator.add(prediction)
+        self.show()
+    
+    def show(self, force=False):
+        if not force and time.monotonic() - self.last_render < self.interval:
+            return
+        self.last_render = time.monotonic()
+        
+        table = self.aggregator.table()
+        try:
+            formatted_table = format_test_table(table, self.total_questions)
+        except:
+            formatted_table = table
+            
+        clear_output(wait=True)
+        display(formatted_table)
+
+def pending_predictions(questions, primary_models, secundary_models, predict_data, shuffle=False, layout=None):
+    to_update = []
+    layout = check_layout(layout)
+
+    for primary_model, secundary_model, question in product(primary_models, secundary_models if secundary_models else [None], questions):
+        model_name = f"{secundary_model}+{primary_model}" if secundary_model else primary_model
+        predict_name = f"{question['id']}-{model_name}"
+        # Predições antigas não têm o layout e foram feitas no formato original
+        done = predict_data.get(predict_name)
+        if done is None or (done.get('prompt_layout') or PROMPT_LAYOUTS[0]) != layout:
+            to_update.append((primary_model, secundary_model, question, model_name, predict_name))
+
+    if shuffle:
+        random.shuffle(to_update)
+    
+    return to_update
+
+def predict_question(primary_model, secundary_model, question, model_name, timeout, test_result, early_stop=None, layout=None,
+                     use_cache=True, cancel=None):
+    """Executa a predição de uma questão e retorna o registro a ser salvo, ou None caso ocorra um erro."""
+    question_id = question['id']
+    model = None
+    try:          
+        # Carrego as imagens, se houverem
+        stage_start = time.perf_counter()
+        images = get_images(question)
+        image_time = time.perf_counter() - stage_start
+        
+        # Inicio o tempo da execução
+        start_time = time.time_ns()
+        
+        # Cria o texto da questão para ser enviada
+        stage_start = time.perf_counter()
+        vision_calls = []
+        question_text = text_question(question, layout) if secundary_model is None else \
+            question_text_vision(secundary_model, question, images, timeout=(timeout//2) if timeout is not None else None,
+                                 vision_calls=vision_calls, layout=layout, use_cache=use_cache, cancel=cancel)
+        vision_time = sum(vision_calls)
+        prompt_time = time.perf_counter() - stage_start - vision_time
+        
+        # Caso o modelo principal não seja de visão, poe como null as imagens para evitar problemas
+        if (model := models_info.models.get(primary_model)) is None or model['algorithm'] != 'vision':
+            images = None
+            
+        # Envia para a LLM principal
+        response = send_text(
+            model=primary_model, 
+            prompt=question_text,
+            images= images,
+            timeout=timeout,
+            early_stop=early_stop,
+            use_cache=use_cache,
+            cancel=cancel
+        )
+        
+        # Encerra o tempo de execução do teste
+        exec_time = (time.time_ns() - start_time) / 10**9 
+        # Extrai a resposta
+        answer = extract_answer(response)
+        # Métricas da geração (vazias quando a resposta veio do cache)
+        stats = generation_stats(response)
+        # O tempo economizado é estimado pelo tamanho médio das respostas completas do mesmo modelo
+        time_saved = None
+        if stats.get('early_stop'):
+            time_saved = estimate_time_saved(model_name, stats.get('tokens') or 0, stats.get('generation_time') or 0)
+        elif stats.get('early_stop') is False:
+            record_completion(model_name, stats.get('tokens'))
+        
+        test_result['ok'].append(({'question' : question, 'model' : model}))
+        
+        # Dados de predição
+        return {
+            "question": question_id,
+            "model": model_name,
+            "response": response,
+            "response_length" : len(response),
+            "answer": answer,
+            "correct": question["correct_alternative"] == answer,
+            "time": exec_time,
+            "discipline" : question['discipline'],
+            "timeout" : None,
+            "tokens" : stats.get('tokens'),
+            "early_stop" : stats.get('early_stop'),
+            "time_saved" : time_saved,
+            # Tempo de cada etapa, em segundos
+            "image_time" : image_time,
+            "vision_time" : vision_time if secundary_model is not None else None,
+            "vision_calls" : vision_calls if secundary_model is not None else None,
+            "prompt_time" : prompt_time,
+            "queue_time" : stats.get('queue_wait'),
+            "ttft" : stats.get('ttft'),
+            "generation_time" : stats.get('generation_time'),
+            # Contagem do backend quando disponível; senão, estimada pelo tiktoken
+            "prompt_tokens" : stats.get('prompt_tokens') or count_tokens(question_text),
+            "eval_time" : stats.get('eval_time'),
+            "prompt_eval_time" : stats.get('prompt_eval_time'),
+            "usage_source" : stats.get('usage_source'),
+            "prompt_layout" : check_layout(layout),
+        }
+        
+    except TimeoutError as te:
+        test_result['error'].append(({'question' : question['id'], 'model' : model, 'error' : str(te), 'traceback' : traceback.format_exc()}))
+        error_str = f"Timeout Error, a questão {question_id} no modelo {model} passou de {timeout} segundos de execução"
+        warnings.warn(error_str)
+        return {
+            "question": question_id,
+            "model": primary_model if secundary_model is None else f"{secundary_model}+{primary_model}",
+            "response": None,
+            "response_length" : None,
+            "answer": None,
+            "correct": None,
+            "time": None,
+            "discipline" : question['discipline'],
+            "timeout" : timeout,
+            "tokens" : None,
+            "early_stop" : None,
+            "time_saved" : None,
+            "image_time" : None,
+            "vision_time" : None,
+            "vision_calls" : None,
+            "prompt_time" : None,
+            "queue_time" : None,
+            "ttft" : None,
+            "generation_time" : None,
+            "prompt_tokens" : None,
+            "eval_time" : None,
+            "prompt_eval_time" : None,
+            "usage_source" : None,
+            "prompt_layout" : check_layout(layout),
+        }
+    except CancelledError:
+        # Teste interrompido: a predição não é registrada nem contada como erro
+        raise
+    except Exception as e:
+        test_result['error'].append(({'question' : question['id'], 'model' : model, 'error' : str(e), 'traceback' : traceback.format_exc()}))
+        error_str = f"Error ao gerar resposta para a pergunta {question_id} do modelo {model}: {e}"
+        warnings.warn(error_str)
+        return None
+
+def prefetch_vision(vision_batches, timeout, test_result, use_cache=True):
+    """Gera antecipadamente as descrições de imagens, um modelo de visão por vez."""
+    for vision_model, vision_questions in vision_batches:
+        for question in tqdm.tqdm(vision_questions, desc=f"Visão {vision_model}"):
+            try:
+                question_text_vision(vision_model, question, get_images(question), timeout=(timeout//2) if timeout is not None else None,
+                                     use_cache=use_cache)
+            except Exception as e:
+                # A questão será tentada novamente durante a etapa de texto
+                test_result['error'].append(({'question' : question['id'], 'model' : vision_model, 'error' : str(e), 'traceback' : traceback.format_exc()}))
+                warnings.warn(f"Error ao descrever as imagens da questão {question['id']} no modelo {vision_model}: {e}")
+
+def plan_predictions(questions, primary_models, secundary_models, predict_data, shuffle, schedule, layout=None):
+    """Lista as predições pendentes no layout e, com `schedule`, as ordena para minimizar trocas de modelo no Ollama."""
+    to_update = pending_predictions(questions, primary_models, secundary_models, predict_data, shuffle and not schedule, layout)
+    if not schedule:
+        return to_update, [], None
+    return schedule_predictions(to_update, shuffle)
+
+def check_predict_file(prompt_layout, predict_file):
+    """Outros layouts precisam de um arquivo de predições próprio: as chaves (questão-modelo) são as mesmas e as
+    predições do formato original seriam sobrescritas. Os dois arquivos são comparados pelo layout_savings."""
+    if prompt_layout != PROMPT_LAYOUTS[0] and predict_file is None:
+        raise ValueError(f"O layout {prompt_layout} precisa de um predict_file próprio, separado das predições do layout {PROMPT_LAYOUTS[0]}")
+    return prompt_layout
+
+def select_questions(questions) -> list[dict]:
+    """Questões do teste a partir de uma lista de questões, de ids ou de um dict de filtros do query_questions
+    (ex.: {'types': ['only-text'], 'disciplines': ['matematica']}), consultando o Parquet apenas no necessário."""
+    if isinstance(questions, dict):
+        return query_questions(**questions)
+    questions = list(questions)
+    if not questions or isinstance(questions[0], dict):
+        return questions
+    by_id = {question['id'] : question for question in query_questions(ids=questions)}
+    return [by_id[int(question_id)] for question_id in questions if int(question_id) in by_id]
+
+def test_models(questions, primary_models, secundary_models=None, predict_file=None, timeout=None, shuffle=False,
+                concurrency=None, provider_limits=None, model_limits=None, schedule=False, early_stop=None, prompt_layout=None,
+                use_cache=True):
+    # Modo concorrente: delega para o motor assíncrono
+    if concurrency is not None:
+        nest_asyncio.apply()
+        return asyncio.run(test_models_async(
+            questions, primary_models, secundary_models, predict_file, timeout, shuffle,
+            concurrency=concurrency, provider_limits=provider_limits, model_limits=model_limits, schedule=schedule,
+            early_stop=early_stop, prompt_layout=prompt_layout, use_cache=use_cache
+        ))
+    
+    early_stop = EarlyStopRules() if early_stop is True else early_stop or None
+    prompt_layout = check_predict_file(check_layout(prompt_layout), predict_file)
+    questions = select_questions(questions)
+    
     questions_str = list(map(lambda x : str(x['id']), questions))
     
     # Dicionário de Resultados do Treinamento
@@ -145,104 +466,144 @@ def test_models(questions, primary_models, secundary_models=None, predict_file=N
         else load_predictions(questions_str,primary_models, secundary_models)
     )
     
+    seed_completions(predict_data.values())
+    
     table_models = gen_modelos_str(primary_models, secundary_models=secundary_models)
     
-    table = test_table(questions=questions_str, models=table_models)
+    live_table = LiveTable(questions_str, table_models, predict_data)
+    live_table.show(force=True)
+    
+    to_update, vision_batches, test_result['schedule'] = plan_predictions(
+        questions, primary_models, secundary_models, predict_data, shuffle, schedule, prompt_layout
+    )
+    
+    predict_path = "./data/predict_data/local_predictions.json" if predict_file is None else predict_file
+    
     try:
-        formatted_table = format_test_table(table, len(questions))
-    except:
-        formatted_table = table
+        prefetch_vision(vision_batches, timeout, test_result, use_cache)
         
-    clear_output(wait=True)
-    display(formatted_table)
+        for primary_model, secundary_model, question, model_name, predict_name in tqdm.tqdm(to_update, desc="Teste"):
+            prediction = predict_question(primary_model, secundary_model, question, model_name, timeout, test_result, early_stop,
+                                          prompt_layout, use_cache)
+            if prediction is not None:
+                predict_data[predict_name] = prediction
+                # Salva apenas a nova predição no journal
+                append_json({predict_name : prediction}, predict_path)
+                # Atualiza e plota a tabela
+                live_table.add(prediction)
+    finally:
+        compact_json(predict_path)
+        vision_cache.compact()
+        live_table.show(force=True)
     
-    to_update = []
+    return test_result
 
-    for primary_model, secundary_model, question in product(primary_models, secundary_models if secundary_models else [None], questions):
-        model_name = f"{secundary_model}+{primary_model}" if secundary_model else primary_model
-        predict_name = f"{question['id']}-{model_name}"
-        if predict_name not in predict_data:
-            to_update.append((primary_model, secundary_model, question, model_name, predict_name))
+def get_provider(model):
+    if 'gemini' in model:
+        return 'gemini'
+    if 'gpt' in model:
+        return 'openai'
+    return 'ollama'
 
-    if shuffle:
-        random.shuffle(to_update)
+# Limites padrão de chamadas simultâneas por provedor
+DEFAULT_PROVIDER_LIMITS = {'ollama' : 1, 'gemini' : 4, 'openai' : 4}
+
+class ConcurrencyLimiter:
+    """Semáforos por provedor e por modelo usados pelo modo assíncrono do test_models."""
     
-    for primary_model, secundary_model, question, model_name, predict_name in tqdm.tqdm(to_update, desc="Teste"):
-        question_id = question['id']
-        model = None
-        try:          
-            # Carrego as imagens, se houverem
-            images = get_images(question)
-            
-            # Inicio o tempo da execução
-            start_time = time.time_ns()
-            
-            # Cria o texto da questão para ser enviada
-            question_text = text_question(question) if secundary_model is None else \
-                question_text_vision(secundary_model, question, images, timeout=(timeout//2) if timeout is not None else None)
-            
-            # Caso o modelo principal não seja de visão, poe como null as imagens para evitar problemas
-            if (model := models_info.models.get(primary_model)) is None or model['algorithm'] != 'vision':
-                images = None
-                
-            # Envia para a LLM principal
-            response = send_text(
-                model=primary_model, 
-                prompt=question_text,
-                images= images,
-                timeout=timeout
+    def __init__(self, provider_limits=None, model_limits=None, default_model_limit=None):
+        self.provider_limits = {**DEFAULT_PROVIDER_LIMITS, **(provider_limits or {})}
+        self.model_limits = model_limits or {}
+        self.default_model_limit = default_model_limit
+        self.semaphores: dict[tuple[str, str], asyncio.Semaphore] = {}
+    
+    def keys(self, *models):
+        keys = set()
+        for model in models:
+            if model is None:
+                continue
+            if (provider := get_provider(model)) in self.provider_limits:
+                keys.add(('provider', provider))
+            if model in self.model_limits or self.default_model_limit is not None:
+                keys.add(('model', model))
+        # Ordem fixa de aquisição para evitar deadlock entre tarefas
+        return sorted(keys)
+    
+    def semaphore(self, key):
+        if key not in self.semaphores:
+            kind, name = key
+            limit = self.provider_limits[name] if kind == 'provider' else self.model_limits.get(name, self.default_model_limit)
+            self.semaphores[key] = asyncio.Semaphore(limit)
+        return self.semaphores[key]
+    
+    @contextlib.asynccontextmanager
+    async def slot(self, *models):
+        async with contextlib.AsyncExitStack() as stack:
+            for key in self.keys(*models):
+                await stack.enter_async_context(self.semaphore(key))
+            yield
+
+async def test_models_async(questions, primary_models, secundary_models=None, predict_file=None, timeout=None, shuffle=False,
+                            concurrency=4, provider_limits=None, model_limits=None, default_model_limit=None, schedule=False,
+                            early_stop=None, prompt_layout=None, use_cache=True):
+    """Versão concorrente do test_models, respeitando limites de concorrência por provedor e por modelo."""
+    early_stop = EarlyStopRules() if early_stop is True else early_stop or None
+    prompt_layout = check_predict_file(check_layout(prompt_layout), predict_file)
+    questions = select_questions(questions)
+    questions_str = list(map(lambda x : str(x['id']), questions))
+    predict_path = "./data/predict_data/local_predictions.json" if predict_file is None else predict_file
+    
+    test_result = {'ok' : [], 'error' : []}
+    
+    predict_data = (
+        load_json(predict_file, pass_error=True) if predict_file is not None
+        else load_predictions(questions_str,primary_models, secundary_models)
+    )
+    
+    seed_completions(predict_data.values())
+    
+    table_models = gen_modelos_str(primary_models, secundary_models=secundary_models)
+    
+    live_table = LiveTable(questions_str, table_models, predict_data)
+    live_table.show(force=True)
+    
+    to_update, vision_batches, test_result['schedule'] = plan_predictions(
+        questions, primary_models, secundary_models, predict_data, shuffle, schedule, prompt_layout
+    )
+    
+    limiter = ConcurrencyLimiter(provider_limits, model_limits, default_model_limit)
+    total = asyncio.Semaphore(concurrency)
+    # Sinaliza às chamadas em andamento nas threads que o teste foi interrompido (cancelamento da tarefa ou Ctrl-C)
+    cancel = threading.Event()
+    
+    # Cada chamada ocupa um worker do pool enquanto espera a resposta
+    get_pool().ensure_size(concurrency)
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    progress = tqdm.tqdm(total=len(to_update), desc="Teste")
+    
+    async def run(primary_model, secundary_model, question, model_name, predict_name):
+        async with limiter.slot(primary_model, secundary_model), total:
+            prediction = await loop.run_in_executor(
+                executor, predict_question, primary_model, secundary_model, question, model_name, timeout, test_result, early_stop,
+                prompt_layout, use_cache, cancel
             )
-            
-            # Encerra o tempo de execução do teste
-            exec_time = (time.time_ns() - start_time) / 10**9 
-            # Extrai a resposta
-            answer = extract_answer(response)
-            # Adiciona nos dados de predição
-            predict_data[predict_name] = {
-                "question": question_id,
-                "model": model_name,
-                "response": response,
-                "response_length" : len(response),
-                "answer": answer,
-                "correct": question["correct_alternative"] == answer,
-                "time": exec_time,
-                "discipline" : question['discipline'],
-                "timeout" : None
-            }
-            
-            test_result['ok'].append(({'question' : question, 'model' : model}))
-            
-        except TimeoutError as te:
-            predict_data[predict_name] = {
-                "question": question_id,
-                "model": primary_model if secundary_model is None else f"{secundary_model}+{primary_model}",
-                "response": None,
-                "response_length" : None,
-                "answer": None,
-                "correct": None,
-                "time": None,
-                "discipline" : question['discipline'],
-                "timeout" : timeout
-            }
-            test_result['error'].append(({'question' : question['id'], 'model' : model, 'error' : str(te), 'traceback' : traceback.format_exc()}))
-            error_str = f"Timeout Error, a questão {question_id} no modelo {model} passou de {timeout} segundos de execução"
-            warnings.warn(error_str)
-        except Exception as e:
-            test_result['error'].append(({'question' : question['id'], 'model' : model, 'error' : str(e), 'traceback' : traceback.format_exc()}))
-            error_str = f"Error ao gerar resposta para a pergunta {question_id} do modelo {model}: {e}"
-            warnings.warn(error_str)
-        finally:
-            # Atualiza a tabela
-            update_json(predict_data, "./data/predict_data/local_predictions.json" if predict_file is None else predict_file)
-            
-            # Plota a tabela
-            table = test_table(questions=questions_str, models=table_models)
-            try:
-                formatted_table = format_test_table(table, len(questions))
-            except:
-                formatted_table = table
-                
-            clear_output(wait=True)
-            display(formatted_table)
-    
-    return test_result
\ No newline at end of file
+        # As escritas acontecem sempre no loop de eventos, uma de cada vez
+        if prediction is not None:
+            predict_data[predict_name] = prediction
+            append_json({predict_name : prediction}, predict_path)
+            live_table.add(prediction)
+        progress.update()
+    
+    try:
+        await loop.run_in_executor(executor, prefetch_vision, vision_batches, timeout, test_result, use_cache)
+        await asyncio.gather(*(run(*item) for item in to_update))
+    finally:
+        cancel.set()
+        progress.close()
+        executor.shutdown(wait=False, cancel_futures=True)
+        compact_json(predict_path)
+        vision_cache.compact()
+        live_table.show(force=True)
+    
+    return test_result
@@ -0,0 +1,75 @@
+import random
+from itertools import groupby
+
+def is_local(model):
+    # Apenas os modelos do Ollama precisam ser carregados na memória do host
+    return model is not None and 'gemini' not in model and 'gpt' not in model
+
+def vision_calls(question):
+    """Quantidade de chamadas ao modelo de visão que uma questão exige."""
+    match(question.get('type')):
+        case 'context-image':
+            return 1
+        case 'answer-image':
+            return 5
+        case 'full-image':
+            return 6
+        case _:
+            return 0
+
+def model_sequence(to_update):
+    """Sequência de modelos usados, na ordem em que as chamadas acontecem."""
+    sequence = []
+    for primary_model, secundary_model, question, _, _ in to_update:
+        if secundary_model is not None:
+            sequence.extend([secundary_model] * vision_calls(question))
+        sequence.append(primary_model)
+    return sequence
+
+def model_loads(sequence):
+    """Conta quantas vezes um modelo local precisa ser (re)carregado na sequência de chamadas."""
+    local_models = [model for model in sequence if is_local(model)]
+    return sum(1 for _ in groupby(local_models))
+
+def schedule_predictions(to_update, shuffle=False):
+    """Agrupa as predições pendentes pelo modelo que precisa estar carregado.
+
+    Primeiro são geradas, por modelo de visão, todas as descrições de imagens necessárias
+    (que ficam no cache de descrições) e depois as predições, agrupadas pelo modelo de texto.
+    Com `shuffle`, a ordem das questões é aleatória dentro de cada lote.
+
+    Retorna a nova ordem das predições, o trabalho de visão por modelo e as estatísticas de carga.
+    """
+    naive_loads = model_loads(model_sequence(to_update))
+
+    batches: dict[tuple, list] = {}
+    vision_work: dict[str, dict] = {}
+    for item in to_update:
+        primary_model, secundary_model, question, _, _ = item
+        batches.setdefault((primary_model, secundary_model or ''), []).append(item)
+        if secundary_model is not None and vision_calls(question) > 0:
+            vision_work.setdefault(secundary_model, {})[question['id']] = question
+
+    ordered = []
+    for key in sorted(batches):
+        batch = batches[key]
+        if shuffle:
+            random.shuffle(batch)
+        ordered.extend(batch)
+
+    vision_batches = []
+    for vision_model in sorted(vision_work):
+        questions = list(vision_work[vision_model].values())
+        if shuffle:
+            random.shuffle(questions)
+        vision_batches.append((vision_model, questions))
+
+    # Com as descrições já em cache, a etapa de texto só carrega os modelos principais
+    vision_sequence = [
+        vision_model for vision_model, questions in vision_batches
+        for question in questions for _ in range(vision_calls(question))
+    ]
+    loads = model_loads(vision_sequence) + model_loads([item[0] for item in ordered])
+
+    stats = {'naive_loads' : naive_loads, 'loads' : loads, 'avoided' : max(0, naive_loads - loads)}
+    return ordered, vision_batches, stats
@@ -0,0 +1,59 @@
+import os
+import threading
+from lib.utils import load_json, append_json, compact_json
+
+VISION_CACHE_FILE = "./data/predict_data/vision_descriptions.json"
+
+class VisionDescriptionCache:
+    """Cache persistente das descrições geradas pelo modelo de visão.
+
+    A descrição depende apenas de (modelo de visão, questão, imagem), então pode ser
+    reaproveitada por todos os modelos de texto combinados com o mesmo modelo de visão.
+    """
+
+    def __init__(self, filename=VISION_CACHE_FILE):
+        self.filename = filename
+        self.data = None
+        self.lock = threading.Lock()
+        self.key_locks: dict[str, threading.Lock] = {}
+        self.stats = {'hits' : 0, 'misses' : 0}
+
+    @staticmethod
+    def key(model_vision, question_id, image_slot):
+        return f"{question_id}-{model_vision}-{image_slot}"
+
+    def load(self):
+        with self.lock:
+            if self.data is None:
+                self.data = load_json(self.filename, pass_error=True)
+        return self.data
+
+    def key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def describe(self, model_vision, question_id, image_slot, generate):
+        """Retorna a descrição salva ou chama `generate()` e persiste o resultado."""
+        key = self.key(model_vision, question_id, image_slot)
+        data = self.load()
+
+        # Evita que duas tarefas concorrentes peçam a mesma descrição
+        with self.key_lock(key):
+            if (description := data.get(key)) is not None:
+                self.stats['hits'] += 1
+                return description
+
+            self.stats['misses'] += 1
+            description = generate()
+            data[key] = description
+
+            os.makedirs(os.path.dirname(self.filename) or '.', exist_ok=True)
+            append_json({key : description}, self.filename)
+
+        return description
+
+    def compact(self):
+        return compact_json(self.filename)
+
+
+vision_cache = VisionDescriptionCache()
@@ -5,49 +5,100 @@ import os
 from typing import Optional
 from itertools import product
 from lib.utils.models_info import models as models_json
+from lib.utils.metrics import MetricsAggregator, model_size, STAGE_COLUMNS, MEAN_COLUMNS, RATE_COLUMNS, MEASURED_USAGE
 import warnings
 import time
 
+def journal_path(filename)->str:
+    """Caminho do journal (JSON Lines) associado a um arquivo JSON."""
+    return f"{filename}.journal"
+
+def read_journal(filename)->dict:
+    """Lê os registros do journal, ignorando uma última linha truncada por uma execução interrompida."""
+    data = {}
+    try:
+        with open(journal_path(filename), 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                data[entry['key']] = entry['value']
+    except FileNotFoundError:
+        pass
+    return data
+
 def load_json(filename, pass_error:bool=False)->dict:
-    """Carrega dados de um arquivo JSON."""
+    """Carrega dados de um arquivo JSON, somando os registros ainda não compactados do journal."""
     try:
-        with open(filename, 'r', encoding='utf8') as file:
-            return json.load(file)
+        journal = read_journal(filename)
+        try:
+            with open(filename, 'r', encoding='utf8') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            if not journal:
+                raise
+            data = {}
+        if journal:
+            data.update(journal)
+        return data
     except Exception as e:
         if pass_error:
             return {}
         else:
             raise e
 
+def write_json(obj, filename, indent=4):
+    """Escreve o JSON de forma atômica: um arquivo temporário é gravado e depois substitui o original."""
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, 'w', encoding='utf-8') as file:
+        json.dump(obj, file, indent=indent)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_filename, filename)
+
 def update_json(obj,filename)->bool:
     """Atualiza dados de um arquivo JSON."""
     try:
-        if os.path.exists(filename):
-            with open(filename, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        else:
-            data = {}
+        data = load_json(filename) if os.path.exists(filename) or os.path.exists(journal_path(filename)) else {}
 
         data.update(obj)
         
-        with open(filename, 'w', encoding='utf-8') as file:
-            json.dump(data, file, indent=4)
+        write_json(data, filename)
+        if os.path.exists(journal_path(filename)):
+            os.remove(journal_path(filename))
         return True
     except Exception as e:
         return False
 
+def append_json(obj:dict, filename)->bool:
+    """Acrescenta registros ao journal do arquivo, sem reescrever o snapshot."""
+    try:
+        with open(journal_path(filename), 'a+b') as file:
+            # Isola uma linha truncada por uma escrita interrompida
+            if file.tell() > 0:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b"\n":
+                    file.write(b"\n")
+        with open(journal_path(filename), 'a', encoding='utf-8') as file:
+            for key, value in obj.items():
+                file.write(json.dumps({'key' : key, 'value' : value}) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        return True
+    except Exception as e:
+        return False
+
+def compact_json(filename)->bool:
+    """Incorpora o journal ao snapshot do arquivo JSON e remove o journal."""
+    if not os.path.exists(journal_path(filename)):
+        return True
+    # Se a execução cair entre a troca do snapshot e a remoção do journal, reaplicá-lo é idempotente
+    return update_json({}, filename)
+
 def get_predict_data(models, questions):
-    if questions and isinstance(questions[0], dict):
-        questions = list(map(lambda x : str(x['id']), questions))
-    
-    questions = list(map(str, questions))
-    
-    predictions = load_json('./data/predict_data/local_predictions.json')
-    
-    return {
-        f"{question}-{model}": prediction for prediction in predictions.values()
-        if ((model := prediction["model"]) in models) and ((question := str(prediction["question"])) in questions)
-    }
+    from lib.utils.predictions import prediction_frame
+    return prediction_frame.records(models, questions)
     
 
 def gen_modelos_str(primary_models:list[str], questions=None, secundary_models=None):
@@ -99,95 +150,14 @@ def test_table(questions: Optional[list[str]] = None, models: Optional[list[str]
             
     if predict_data is None:
         if predict_path is not None:
-            with open(predict_path, encoding='utf-8') as f:
-                predict_data = json.load(f)
+            predict_data = load_json(predict_path)
         else:
-            predict_data = load_predictions(questions, models)
+            from lib.utils.predictions import prediction_frame
+            predict_data = prediction_frame.records(models, questions)
 
-    models_dict: dict[str, list] = {model: [] for model in models} if models is not None else {}
+    total_questions = len(questions) if questions else None
 
-    for question in predict_data.values():
-        if question["model"] in models_dict:
-            models_dict[question["model"]].append(question)
-        elif models is not None and question["model"] not in models:
-            continue
-        else:
-            models_dict[question["model"]] = [question]
-
-    total_questions = (
-        len(questions) if questions else
-        max(len(qs) for qs in models_dict.values()) if models_dict else len(predict_data)
-    )
-
-    table_data = []
-    total_metrics = {
-        "Finish": 0, "OK": 0, "Null": 0, "Err": 0, "Tout": 0, "Acc": 0,
-        "Ttot": 0, "TTout": 0, "Tle": 0, "Tavg": 0, "Tmax": 0, "Tmin": float("inf"),
-        "Size": 0
-    }
-
-    for model_name, model_questions in models_dict.items():
-        metrics = {
-            "Model": model_name,
-            "Size": 0, 
-            "Finish": len(model_questions),
-            "OK": sum(1 for q in model_questions if q["correct"]),
-            "Null": sum(1 for q in model_questions if q["answer"] is None and q["timeout"] is None),
-            "Tout": sum(1 for q in model_questions if q.get("timeout") is not None),
-            "Err": 0,  
-            "Acc": 0,  
-            "Prec": 0,  
-            "Ttot": sum(q["time"] for q in model_questions if q['time']),
-            "TTout": 0,  
-            "Tle": 0, 
-            "Tavg": 0, 
-            "Tmax": max((q["time"] for q in model_questions if q['time']), default=0),
-            "Tmin": min((q["time"] for q in model_questions if q['time']), default=float("inf")),
-        }
-
-        metrics["Err"] = metrics["Finish"] - metrics["OK"] - metrics["Null"] - metrics["Tout"]
-        metrics["Acc"] = metrics["OK"] / max(1, metrics["Finish"])  # Evita divisão por zero
-        metrics["Prec"] = metrics["OK"] / max(1, metrics["OK"] + metrics["Err"])
-        metrics["TTout"] = metrics["Ttot"] + sum(q.get("timeout") for q in model_questions if q.get("timeout") is not None)
-        metrics["Tle"] = (metrics["Ttot"] / max(1, metrics["Finish"])) * (total_questions - metrics["Finish"]) if metrics["Finish"] > 0 else 0
-        metrics["Tavg"] = metrics["Ttot"] / max(1, metrics["Finish"])  # Tempo médio
-        
-        # Definição do tamanho do modelo
-        if "+" in model_name:
-            m1, m2 = model_name.split("+")
-            model_size = models_json.get(m1, {}).get('size', 0) + models_json.get(m2, {}).get('size', 0)
-            if model_size == 0:
-                model_size = None
-                warnings.warn(f"O modelo {model_name} não foi encontrado")
-                time.sleep(1)
-        else:
-            model_size = models_json.get(model_name, {}).get('size')
-
-        metrics["Size"] = round(model_size, 1) if model_size is not None else None
-
-        # Atualizando totais
-        for key in total_metrics:
-            if key in ["Tmin"]:
-                total_metrics[key] = min(total_metrics[key], (metrics[key] if metrics[key] is not None else float('inf')))
-            elif key in ["Tmax"]:
-                total_metrics[key] = max(total_metrics[key], (metrics[key] if metrics[key] is not None else -1*(float('inf'))))
-            else:
-                total_metrics[key] += metrics[key] if metrics[key] is not None else 0
-
-        table_data.append(metrics)
-
-    # Adiciona a linha TOTAL
-    total_metrics["Model"] = "TOTAL"
-    total_metrics["Acc"] = total_metrics["OK"] / max(1, total_metrics["Finish"])
-    total_metrics["Prec"] = total_metrics["OK"] / max(1, total_metrics["OK"] + total_metrics["Err"])
-    total_metrics["Tavg"] = total_metrics["Ttot"] / max(1, total_metrics["Finish"])
-    total_metrics["Tle"] = sum(l['Tle'] for l in table_data)
-    total_metrics["Size"] = round(total_metrics["Size"], 1)
-
-    df = pd.DataFrame(sorted(table_data, key=lambda x: x["Acc"], reverse=True))  # Ordena antes de adicionar TOTAL
-    df.loc[len(df)] = total_metrics
-    
-    return df
+    return MetricsAggregator(models, total_questions).update(predict_data.values()).table()
 
 
 def format_test_table(df: pd.DataFrame, total_questions: Optional[int] = None) -> pd.DataFrame:
@@ -195,8 +165,9 @@ def format_test_table(df: pd.DataFrame, total_questions: Optional[int] = None) -
     df_copy = df.copy()
     
     # Formatar colunas de tempo
-    for col in ["Ttot", "Tle", "Tavg", "Tmax", "Tmin", "TTout"]:
-        df_copy[col] = df_copy[col].apply(format_time)
+    for col in ["Ttot", "Tle", "Tavg", "Tmax", "Tmin", "TTout", *STAGE_COLUMNS]:
+        if col in df_copy:
+            df_copy[col] = df_copy[col].apply(format_time)
     
     # Garantir que total_questions esteja correto
     if total_questions is None:
@@ -227,6 +198,20 @@ def calcular_metricas(grupo):
     tle = (total - (ok + null + tout + err))*tavg
     tmax = grupo['time'].max()
     tmin = grupo['time'].min()
+    # Médias das etapas e tokens apenas entre as predições que têm a medição
+    means = {
+        column : grupo[field].dropna().astype(float).mean() if field in grupo else float('nan')
+        for column, field in MEAN_COLUMNS.items()
+    }
+    # Taxas apenas das predições medidas pelo backend
+    backend = grupo['usage_source'] == MEASURED_USAGE if 'usage_source' in grupo else pd.Series(False, index=grupo.index)
+    for column, (tokens_field, time_field) in RATE_COLUMNS.items():
+        if tokens_field in grupo and time_field in grupo:
+            medido = grupo[backend & (grupo[tokens_field].notna()) & (grupo[time_field] > 0)]
+            segundos = medido[time_field].sum()
+            means[column] = float(medido[tokens_field].sum()) / segundos if segundos else float('nan')
+        else:
+            means[column] = float('nan')
     return pd.Series({
         'Total': total,
         'OK': ok,
@@ -238,13 +223,14 @@ def calcular_metricas(grupo):
         'Tle': tle,
         'Tavg': tavg,
         'Tmax': tmax,
-        'Tmin': tmin
+        'Tmin': tmin,
+        **means
     })
 
 def analisar_tabela(df, column):
     df['time'] = df['time'].fillna(0)
 
-    resultado = df.groupby(column)\
+    resultado = df.groupby(column, observed=True)\
         .apply(calcular_metricas).\
             reset_index()\
                 .sort_values("OK", ascending=False, ignore_index=True)
@@ -252,8 +238,5 @@ def analisar_tabela(df, column):
     return resultado
 
 def tabela_geral(questions, models):
-    table = load_predictions(
-    questions=questions,
-    primary_models=models
-    )
-    return pd.DataFrame(table.values())
\ No newline at end of file
+    from lib.utils.predictions import prediction_frame
+    return prediction_frame.query(models, questions)
@@ -0,0 +1,125 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+import matplotlib.pyplot as plt
+
+FIGURES_DIR = "./data/cache/figures"
+
+# Mesma resolução usada pelo st.pyplot
+FIGURE_DPI = 200
+
+class FigureCache:
+    """Cache dos gráficos já renderizados (bytes PNG/SVG), indexado por tipo de gráfico, modelos, questões e versão dos dados.
+
+    A camada em memória é um LRU limitado por `max_bytes`. Se `directory` for informado, as imagens também
+    ficam em disco, de modo que um prewarm feito em outro processo é aproveitado pela aplicação; o disco é
+    limitado por `max_disk_bytes`, apagando primeiro os arquivos usados há mais tempo (inclusive os de versões
+    antigas dos dados, que nunca mais são lidos).
+    """
+
+    def __init__(self, max_bytes=64 * 2**20, directory=None, fmt='png', max_disk_bytes=256 * 2**20):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.directory = directory
+        self.fmt = fmt
+        self.entries: OrderedDict[str, bytes] = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.stats = {'hits' : 0, 'disk_hits' : 0, 'misses' : 0, 'evictions' : 0, 'disk_evictions' : 0}
+
+    def key(self, plot_type, models, questions, version, fmt=None, **params) -> str:
+        """Modelos e questões entram ordenados: a mesma seleção em outra ordem gera o mesmo gráfico."""
+        key = (
+            plot_type, tuple(sorted(map(str, models or []))), tuple(sorted(map(str, questions or []))),
+            version, fmt or self.fmt, tuple(sorted(params.items()))
+        )
+        return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+    def path(self, key, fmt):
+        return os.path.join(self.directory, f"{key}.{fmt}")
+
+    @staticmethod
+    def to_bytes(fig, fmt) -> bytes:
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=fmt, dpi=FIGURE_DPI, bbox_inches='tight')
+        plt.close(fig)
+        return buffer.getvalue()
+
+    def store(self, key, image: bytes):
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = image
+                self.size += len(image)
+            # Remove os gráficos vistos há mais tempo até caber no limite
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, old = self.entries.popitem(last=False)
+                self.size -= len(old)
+                self.stats['evictions'] += 1
+
+    def prune_disk(self):
+        """Apaga os arquivos com acesso mais antigo até o diretório caber em `max_disk_bytes`."""
+        if self.directory is None or self.max_disk_bytes is None or not os.path.isdir(self.directory):
+            return
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(file_size for _, file_size, _ in files)
+        for _, file_size, path in sorted(files):
+            if size <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+            self.stats['disk_evictions'] += 1
+
+    def render(self, plot_type, models, questions, draw, version=None, fmt=None, **params) -> bytes:
+        """Retorna os bytes do gráfico, chamando `draw()` (que devolve uma plt.Figure) apenas na primeira vez."""
+        fmt = fmt or self.fmt
+        key = self.key(plot_type, models, questions, version, fmt, **params)
+        with self.lock:
+            if (image := self.entries.get(key)) is not None:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return image
+
+        if self.directory is not None and os.path.exists(path := self.path(key, fmt)):
+            self.stats['disk_hits'] += 1
+            with open(path, 'rb') as file:
+                image = file.read()
+            # O mtime marca o último uso, que decide a ordem de remoção em prune_disk
+            os.utime(path)
+        else:
+            self.stats['misses'] += 1
+            image = self.to_bytes(draw(), fmt)
+            if self.directory is not None:
+                os.makedirs(self.directory, exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'wb') as file:
+                    file.write(image)
+                os.replace(tmp_path, path)
+                self.prune_disk()
+
+        self.store(key, image)
+        return image
+
+    def clear(self, disk=False):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+        if disk and self.directory is not None and os.path.isdir(self.directory):
+            for filename in os.listdir(self.directory):
+                os.remove(os.path.join(self.directory, filename))
+
+
+figure_cache = FigureCache(
+    max_bytes=int(os.getenv('ESTUDA_FIGURE_CACHE_MB', 64)) * 2**20,
+    directory=os.getenv('ESTUDA_FIGURE_DIR', FIGURES_DIR),
+    fmt=os.getenv('ESTUDA_FIGURE_FORMAT', 'png'),
+    max_disk_bytes=int(os.getenv('ESTUDA_FIGURE_DISK_MB', 256)) * 2**20
+)
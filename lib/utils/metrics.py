@@ -0,0 +1,174 @@
+import warnings
+import time
+import pandas as pd
+from typing import Optional
+from lib.utils.models_info import models as models_json
+
+# Médias por etapa (em segundos) e de tokens: coluna da tabela → campo da predição
+STAGE_COLUMNS = {
+    "Timg": "image_time",
+    "Tvis": "vision_time",
+    "Tprompt": "prompt_time",
+    "Tqueue": "queue_time",
+    "TTFT": "ttft",
+    "Tgen": "generation_time",
+}
+TOKEN_COLUMNS = {
+    "PTok": "prompt_tokens",
+    "CTok": "tokens",
+}
+MEAN_COLUMNS = {**STAGE_COLUMNS, **TOKEN_COLUMNS}
+
+# Taxas em tokens/s: coluna da tabela → (campo de tokens, campo de tempo). São calculadas como soma dos tokens
+# sobre a soma dos tempos, para que respostas longas pesem mais que respostas curtas
+RATE_COLUMNS = {
+    "Tok/s": ("tokens", "eval_time"),
+    "PP/s": ("prompt_tokens", "prompt_eval_time"),
+}
+# As taxas usam só as predições com contagens e tempos medidos pelo backend (sem parada antecipada nem tempos do cliente)
+MEASURED_USAGE = "backend"
+
+def model_size(model_name):
+    """Tamanho em GB do modelo, somando os dois modelos no caso de 'visão+texto'."""
+    if "+" in model_name:
+        m1, m2 = model_name.split("+")
+        size = models_json.get(m1, {}).get('size', 0) + models_json.get(m2, {}).get('size', 0)
+        if size == 0:
+            size = None
+            warnings.warn(f"O modelo {model_name} não foi encontrado")
+            time.sleep(1)
+    else:
+        size = models_json.get(model_name, {}).get('size')
+
+    return round(size, 1) if size is not None else None
+
+
+class MetricsAggregator:
+    """Acumula as métricas do test_table por modelo, atualizando cada predição em O(1)."""
+
+    def __init__(self, models: Optional[list[str]] = None, total_questions: Optional[int] = None):
+        self.models = set(models) if models is not None else None
+        self.total_questions = total_questions
+        self.counters: dict[str, dict] = {}
+        for model in models or []:
+            self.register(model)
+
+    def register(self, model):
+        self.counters[model] = {
+            "Size": model_size(model), "Finish": 0, "OK": 0, "Null": 0, "Tout": 0,
+            "Ttot": 0, "Timeouts": 0, "Tmax": 0, "Tmin": float("inf"),
+            # Soma e quantidade de predições com o campo preenchido (predições antigas não têm as etapas)
+            "Means": {column: [0.0, 0] for column in MEAN_COLUMNS},
+            "Rates": {column: [0, 0.0] for column in RATE_COLUMNS},
+        }
+        return self.counters[model]
+
+    def add(self, prediction: dict):
+        model = prediction["model"]
+        if (counter := self.counters.get(model)) is None:
+            if self.models is not None:
+                return
+            counter = self.register(model)
+
+        counter["Finish"] += 1
+        if prediction["correct"]:
+            counter["OK"] += 1
+        if prediction.get("timeout") is not None:
+            counter["Tout"] += 1
+            counter["Timeouts"] += prediction["timeout"]
+        elif prediction["answer"] is None:
+            counter["Null"] += 1
+        if prediction["time"]:
+            counter["Ttot"] += prediction["time"]
+            counter["Tmax"] = max(counter["Tmax"], prediction["time"])
+            counter["Tmin"] = min(counter["Tmin"], prediction["time"])
+        for column, field in MEAN_COLUMNS.items():
+            if (value := prediction.get(field)) is not None and value == value:
+                counter["Means"][column][0] += value
+                counter["Means"][column][1] += 1
+        if prediction.get("usage_source") == MEASURED_USAGE:
+            for column, (tokens_field, time_field) in RATE_COLUMNS.items():
+                tokens, seconds = prediction.get(tokens_field), prediction.get(time_field)
+                if tokens is not None and seconds is not None and seconds > 0:
+                    counter["Rates"][column][0] += tokens
+                    counter["Rates"][column][1] += seconds
+
+    def update(self, predictions):
+        for prediction in predictions:
+            self.add(prediction)
+        return self
+
+    def row(self, model_name, counter, total_questions):
+        finish = counter["Finish"]
+        metrics = {
+            "Model": model_name,
+            "Size": counter["Size"],
+            "Finish": finish,
+            "OK": counter["OK"],
+            "Null": counter["Null"],
+            "Tout": counter["Tout"],
+            "Err": finish - counter["OK"] - counter["Null"] - counter["Tout"],
+            "Acc": counter["OK"] / max(1, finish),  # Evita divisão por zero
+            "Prec": 0,
+            "Ttot": counter["Ttot"],
+            "TTout": counter["Ttot"] + counter["Timeouts"],
+            "Tle": (counter["Ttot"] / max(1, finish)) * (total_questions - finish) if finish > 0 else 0,
+            "Tavg": counter["Ttot"] / max(1, finish),  # Tempo médio
+            "Tmax": counter["Tmax"],
+            "Tmin": counter["Tmin"],
+        }
+        metrics["Prec"] = metrics["OK"] / max(1, metrics["OK"] + metrics["Err"])
+        metrics.update(self.means([counter]))
+        return metrics
+
+    @staticmethod
+    def means(counters) -> dict:
+        """Médias das etapas e tokens e as taxas de tokens/s somando os contadores informados (None sem nenhuma medição)."""
+        means = {}
+        for column in MEAN_COLUMNS:
+            total = sum(counter["Means"][column][0] for counter in counters)
+            count = sum(counter["Means"][column][1] for counter in counters)
+            means[column] = total / count if count else None
+        for column in RATE_COLUMNS:
+            tokens = sum(counter["Rates"][column][0] for counter in counters)
+            seconds = sum(counter["Rates"][column][1] for counter in counters)
+            means[column] = tokens / seconds if seconds else None
+        return means
+
+    def table(self) -> pd.DataFrame:
+        total_questions = (
+            self.total_questions if self.total_questions else
+            max(c["Finish"] for c in self.counters.values()) if self.counters else 0
+        )
+
+        table_data = [self.row(model_name, counter, total_questions) for model_name, counter in self.counters.items()]
+
+        total_metrics = {
+            "Finish": 0, "OK": 0, "Null": 0, "Err": 0, "Tout": 0, "Acc": 0,
+            "Ttot": 0, "TTout": 0, "Tle": 0, "Tavg": 0, "Tmax": 0, "Tmin": float("inf"),
+            "Size": 0
+        }
+
+        # Atualizando totais
+        for metrics in table_data:
+            for key in total_metrics:
+                if key in ["Tmin"]:
+                    total_metrics[key] = min(total_metrics[key], (metrics[key] if metrics[key] is not None else float('inf')))
+                elif key in ["Tmax"]:
+                    total_metrics[key] = max(total_metrics[key], (metrics[key] if metrics[key] is not None else -1*(float('inf'))))
+                else:
+                    total_metrics[key] += metrics[key] if metrics[key] is not None else 0
+
+        # Adiciona a linha TOTAL
+        total_metrics["Model"] = "TOTAL"
+        total_metrics["Acc"] = total_metrics["OK"] / max(1, total_metrics["Finish"])
+        total_metrics["Prec"] = total_metrics["OK"] / max(1, total_metrics["OK"] + total_metrics["Err"])
+        total_metrics["Tavg"] = total_metrics["Ttot"] / max(1, total_metrics["Finish"])
+        total_metrics["Tle"] = sum(l['Tle'] for l in table_data)
+        total_metrics["Size"] = round(total_metrics["Size"], 1)
+        total_metrics.update(self.means(self.counters.values()))
+
+        df = pd.DataFrame(sorted(table_data, key=lambda x: x["Acc"], reverse=True))  # Ordena antes de adicionar TOTAL
+        df.loc[len(df)] = total_metrics
+
+        return df
@@ -0,0 +1,101 @@
+import os
+import glob
+import re
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+MICRODADOS_DIR = "./data/microdados"
+ITEMS_PARQUET = "./data/microdados/itens_prova.parquet"
+
+# Tipos explícitos das colunas dos arquivos ITENS_PROVA_<ano>.csv
+ITEMS_DTYPES = {
+    "CO_POSICAO" : "int16",
+    "SG_AREA" : "category",
+    "CO_ITEM" : "Int32",
+    "TX_GABARITO" : "category",
+    "CO_HABILIDADE" : "Int8",
+    "IN_ITEM_ABAN" : "Int8",
+    "TX_MOTIVO_ABAN" : "string",
+    "NU_PARAM_A" : "float64",
+    "NU_PARAM_B" : "float64",
+    "NU_PARAM_C" : "float64",
+    "TX_COR" : "string",
+    "CO_PROVA" : "int32",
+    "TP_LINGUA" : "Int8",
+    "IN_ITEM_ADAPTADO" : "Int8",
+    "TP_VERSAO_DIGITAL" : "Int8",
+}
+
+INDEX_COLUMNS = ["NU_ANO", "SG_AREA", "CO_POSICAO"]
+
+def read_items_csv(filename) -> pd.DataFrame:
+    year = int(re.search(r"(\d{4})", os.path.basename(filename)).group(1))
+    header = pd.read_csv(filename, sep=";", encoding="latin-1", nrows=0).columns
+    df = pd.read_csv(
+        filename, sep=";", encoding="latin-1",
+        dtype={column : dtype for column, dtype in ITEMS_DTYPES.items() if column in header}
+    )
+    # Colunas que não existem em todos os anos ficam nulas
+    for column, dtype in ITEMS_DTYPES.items():
+        if column not in df.columns:
+            df[column] = pd.Series(pd.NA, index=df.index, dtype=dtype)
+    df["NU_ANO"] = pd.Series(year, index=df.index, dtype="int16")
+    return df
+
+def build_items_table(directory: str = MICRODADOS_DIR, path: str = ITEMS_PARQUET, max_workers=None) -> pd.DataFrame:
+    """Lê todos os anos em paralelo, remove as repetições do mesmo item entre as cores de caderno
+    e salva uma tabela única, ordenada por (ano, área, posição)."""
+    files = sorted(glob.glob(os.path.join(directory, "ITENS_PROVA_*.csv")))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        frames = list(executor.map(read_items_csv, files))
+
+    df = pd.concat(frames, ignore_index=True)
+    df["SG_AREA"] = df["SG_AREA"].astype("category")
+    df["TX_GABARITO"] = df["TX_GABARITO"].astype("category")
+    df["TX_COR"] = df["TX_COR"].str.upper().astype("category")
+
+    # A posição de referência é a do caderno azul da aplicação regular (menor CO_PROVA)
+    df["QT_CADERNOS"] = df.groupby(["NU_ANO", "CO_ITEM"], dropna=False)["CO_PROVA"].transform("nunique").astype("int16")
+    df["_outra_cor"] = ~df["TX_COR"].astype("string").str.startswith("AZU").fillna(False)
+    referencia = df["CO_PROVA"].where(~df["_outra_cor"]).groupby([df["NU_ANO"], df["SG_AREA"]], observed=True).transform("min")
+    df["IN_CADERNO_REFERENCIA"] = (df["CO_PROVA"] == referencia).astype("int8")
+    df = (
+        df.sort_values(["NU_ANO", "CO_ITEM", "_outra_cor", "CO_PROVA"])
+        .drop_duplicates(["NU_ANO", "CO_ITEM"], keep="first")
+        .drop(columns="_outra_cor")
+        .sort_values(INDEX_COLUMNS + ["TP_LINGUA"])
+        .reset_index(drop=True)
+    )
+
+    columns = INDEX_COLUMNS + [column for column in df.columns if column not in INDEX_COLUMNS]
+    df = df[columns]
+
+    tmp_path = f"{path}.tmp"
+    df.to_parquet(tmp_path, index=False, compression="zstd")
+    os.replace(tmp_path, path)
+    return df
+
+def is_outdated(path: str = ITEMS_PARQUET, directory: str = MICRODADOS_DIR) -> bool:
+    if not os.path.exists(path):
+        return True
+    mtime = os.path.getmtime(path)
+    return any(os.path.getmtime(f) > mtime for f in glob.glob(os.path.join(directory, "ITENS_PROVA_*.csv")))
+
+def load_items(years=None, areas=None, columns=None, path: str = ITEMS_PARQUET) -> pd.DataFrame:
+    """Carrega os itens deduplicados, indexados por (NU_ANO, SG_AREA, CO_POSICAO).
+
+    Itens exclusivos de reaplicações podem repetir a posição; os da prova regular têm IN_CADERNO_REFERENCIA = 1.
+    """
+    if is_outdated(path):
+        build_items_table(path=path)
+
+    filters = []
+    if years is not None:
+        filters.append(("NU_ANO", "in", list(years)))
+    if areas is not None:
+        filters.append(("SG_AREA", "in", list(areas)))
+    if columns is not None:
+        columns = INDEX_COLUMNS + [column for column in columns if column not in INDEX_COLUMNS]
+
+    df = pd.read_parquet(path, columns=columns, filters=filters or None)
+    return df.set_index(INDEX_COLUMNS).sort_index()
@@ -1,7 +1,8 @@
 import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
-from lib.utils import format_time, get_predict_data, gen_modelos_str
+from lib.utils import format_time, gen_modelos_str
+from lib.utils.predictions import prediction_frame
 from typing import Literal
 from matplotlib_venn import venn2_unweighted, venn3_unweighted
 
@@ -98,6 +99,43 @@ def time_metrics_total(df: pd.DataFrame) -> plt.Figure:
     plt.tight_layout()
     return fig
 
+def throughput_metrics(df: pd.DataFrame) -> plt.Figure:
+    """Gera um gráfico de barras com a vazão de geração (Tok/s) e de processamento do prompt (PP/s) por modelo,
+    com o tempo médio até o primeiro token anotado, e retorna o objeto Figure."""
+    df_sorted = df[df["Model"] != "TOTAL"].sort_values(by="Tok/s", ascending=False, na_position="last")
+    models = df_sorted["Model"]
+    generation_rate = df_sorted["Tok/s"].astype(float)
+    prompt_rate = df_sorted["PP/s"].astype(float)
+    ttft = df_sorted["TTFT"].astype(float)
+    
+    fig, ax1 = plt.subplots(figsize=(12, 6))
+    ax2 = ax1.twinx()
+    
+    width = 0.4
+    x = np.arange(len(models))
+
+    bars1 = ax1.bar(x - width/2, generation_rate, width, label='Geração (tokens/s)', color='#99ccff')
+    bars2 = ax2.bar(x + width/2, prompt_rate, width, label='Prompt (tokens/s)', color='#ffcc99')
+    
+    for bar, rate, first_token in zip(bars1, generation_rate, ttft):
+        if pd.notna(rate):
+            label = f"{rate:.1f}" if pd.isna(first_token) else f"{rate:.1f}\nTTFT {first_token:.2f}s"
+            ax1.text(bar.get_x() + bar.get_width()/2, rate * 0.5, label, ha='center', va='center', fontsize=9, color='black')
+
+    for bar, rate in zip(bars2, prompt_rate):
+        if pd.notna(rate):
+            ax2.text(bar.get_x() + bar.get_width()/2, rate * 0.5, f"{rate:.0f}", ha='center', va='center', fontsize=9, color='black')
+
+    ax1.set_xticks(x)
+    ax1.set_xticklabels(models, rotation=45)
+    ax1.set_ylabel("Geração (tokens/s)")
+    ax2.set_ylabel("Processamento do Prompt (tokens/s)")
+    ax1.set_title("Vazão de Tokens por Modelo")
+    ax1.legend(handles=[bars1, bars2], loc='upper center', bbox_to_anchor=(0.5, -0.25), ncol=2)
+    
+    plt.tight_layout()
+    return fig
+
 def axis_type(name):
     match(name):
         case "Tavg":
@@ -139,15 +177,13 @@ def correlation(df: pd.DataFrame, x:Literal["Tavg", "Size", "Acc"]="Tavg", y:Lit
     return fig
 
 def discipline_performance(models, questions, group_model: bool = False, normalize: bool = False) -> plt.Figure:    
-    predict_data = get_predict_data(models, questions)
-            
-    df = pd.DataFrame(predict_data.values())
+    df = prediction_frame.query(models, questions)
     
     df_filtered = df.dropna(subset=["discipline"])
     
     group_by = "model" if group_model else "discipline"
     
-    grouped = df_filtered.groupby([group_by, "model" if not group_model else "discipline"]).agg(
+    grouped = df_filtered.groupby([group_by, "model" if not group_model else "discipline"], observed=True).agg(
         OK=("correct", "sum"),
         Null=("answer", lambda x: x.isna().sum()),
         Total=("question", "count")
@@ -156,7 +192,7 @@ def discipline_performance(models, questions, group_model: bool = False, normali
     grouped["Acc"] = grouped["OK"] / grouped["Total"]
     
     # Ordena os grupos pela acurácia
-    sorted_groups = grouped.groupby(group_by)["Acc"].mean().sort_values(ascending=False).index
+    sorted_groups = grouped.groupby(group_by, observed=True)["Acc"].mean().sort_values(ascending=False).index
     grouped[group_by] = pd.Categorical(grouped[group_by], categories=sorted_groups, ordered=True)
     grouped = grouped.sort_values([group_by, "Acc"], ascending=[True, False])
     
@@ -218,19 +254,18 @@ def discipline_performance(models, questions, group_model: bool = False, normali
 def discipline_time_performance(models, questions, group_model: bool = False) -> plt.Figure:
     """Gera um gráfico de barras mostrando o tempo médio por disciplina e modelo e retorna um objeto plt.Figure."""
     
-    df = pd.DataFrame(get_predict_data(models, questions).values())
+    df = prediction_frame.query(models, questions)
 
-    df_filtered = df.dropna(subset=["discipline"]).copy()
-    df_filtered["time"] = pd.to_numeric(df_filtered["time"], errors="coerce")  # Garante que os tempos sejam numéricos
+    df_filtered = df.dropna(subset=["discipline"])
     
     group_by = "model" if group_model else "discipline"
-    grouped = df_filtered.groupby([group_by, "discipline" if group_model else "model"]).agg(
+    grouped = df_filtered.groupby([group_by, "discipline" if group_model else "model"], observed=True).agg(
         Avg_Time=("time", "mean"),
         Count=("question", "count")
     ).reset_index()
     
     # Ordena os grupos pelo maior tempo médio
-    sorted_groups = grouped.groupby(group_by)["Avg_Time"].mean().sort_values(ascending=False).index
+    sorted_groups = grouped.groupby(group_by, observed=True)["Avg_Time"].mean().sort_values(ascending=False).index
     grouped[group_by] = pd.Categorical(grouped[group_by], categories=sorted_groups, ordered=True)
     grouped = grouped.sort_values([group_by, "Avg_Time"], ascending=[False, False])
     
@@ -275,14 +310,36 @@ def discipline_time_performance(models, questions, group_model: bool = False) ->
     return fig
 
 
+def discipline_throughput(models, questions, column: Literal["Tok/s", "PP/s", "TTFT"] = "Tok/s") -> plt.Figure:
+    """Gera um gráfico de barras agrupadas da vazão de tokens (ou do tempo até o primeiro token) por disciplina e modelo."""
+    from lib.utils import analisar_tabela
+    
+    df = prediction_frame.query(models, questions).dropna(subset=["discipline"])
+    grouped = analisar_tabela(df, ["discipline", "model"]).pivot(index="discipline", columns="model", values=column)
+    
+    labels = {"Tok/s": "Geração (tokens/s)", "PP/s": "Processamento do Prompt (tokens/s)", "TTFT": "Tempo até o Primeiro Token (s)"}
+    
+    fig, ax = plt.subplots(figsize=(max(12, len(grouped.columns) * 1.5), 6))
+    grouped.astype(float).plot(kind='bar', ax=ax, edgecolor='black', width=0.8)
+    
+    ax.set_xlabel("Disciplinas")
+    ax.set_ylabel(labels[column])
+    ax.set_title(f"{labels[column]} por Disciplina e Modelo")
+    ax.set_xticklabels(grouped.index, rotation=0)
+    ax.grid(axis='y', linestyle='--', alpha=0.7)
+    ax.legend(title="Modelos")
+    
+    plt.tight_layout()
+    return fig
+
+
 def discipline_accuracy_vs_time(models, questions)->plt.Figure:
     """Gera um gráfico de dispersão mostrando a correlação entre acurácia e tempo médio por disciplina e modelo."""
-    df = pd.DataFrame(get_predict_data(models, questions).values())
+    df = prediction_frame.query(models, questions)
     
-    df_filtered = df.dropna(subset=["discipline"]).copy()
-    df_filtered["time"] = pd.to_numeric(df_filtered["time"], errors="coerce")
+    df_filtered = df.dropna(subset=["discipline"])
     
-    grouped = df_filtered.groupby(["model", "discipline"]).agg(
+    grouped = df_filtered.groupby(["model", "discipline"], observed=True).agg(
         Avg_Time=("time", "mean"),
         Accuracy=("correct", "mean")
     ).reset_index()
@@ -315,19 +372,9 @@ def multi_model_performance(
     if mixed_models is None:
         mixed_models = gen_modelos_str(primary_models=text_models, secundary_models=vision_models)
     
-    predict_data = get_predict_data(
-        models = mixed_models, 
-        questions= questions
-    ).values()
-    
-    for question in predict_data:
-        question['model_vision'], question['model_text'] = question['model'].split('+')
-        del question['model']
-    
-    df = pd.DataFrame(predict_data)
-    
-    df_filtered = df.copy()
-    df_filtered["time"] = pd.to_numeric(df_filtered["time"], errors="coerce")
+    df_filtered = prediction_frame.query(mixed_models, questions)
+    df_filtered[["model_vision", "model_text"]] = df_filtered["model"].astype(str).str.split("+", expand=True)
+    df_filtered = df_filtered.drop(columns="model")
     
     grouped = df_filtered.groupby(group).agg(
         Avg_Time=("time", "mean"),
@@ -362,12 +409,10 @@ def venn(questions, model1, model2, model3=None) -> plt.Figure:
         models.append(model3)
         vennx = venn3_unweighted
     
-    predict_data = get_predict_data(models, questions)
+    df = prediction_frame.query(models, questions, columns=["question", "model", "correct"])
+    correct = df["correct"].fillna(False)
     
-    sets = [
-        {t['question'] for t in predict_data.values() if t['model'] == model and t['correct']} 
-        for model in models
-    ]
+    sets = [set(df.loc[correct & (df["model"] == model), "question"]) for model in models]
 
     fig, ax = plt.subplots(figsize=(6, 6))
     vennx(sets, set_labels=models, ax=ax)
@@ -407,11 +452,11 @@ def discipline_models(df, disciplina, mode) -> plt.Figure:
     df_filtered = df[df['discipline'] == disciplina]
 
     if mode == 'time':
-        df_grouped = df_filtered.groupby('model')['time'].mean().sort_values(ascending=True)
+        df_grouped = df_filtered.groupby('model', observed=True)['time'].mean().sort_values(ascending=True)
         ylabel = 'Tempo Médio de Resposta (s)'
         title = f'Tempo Médio de Resposta em ({disciplina})'
     elif mode == 'acc':
-        df_grouped = df_filtered[df_filtered['correct'] == True].groupby('model').size().sort_values(ascending=False)
+        df_grouped = df_filtered[df_filtered['correct'] == True].groupby('model', observed=True).size().sort_values(ascending=False)
         ylabel = 'Quantidade de Questões Acertadas'
         title = f'Quantidade de Questões Acertadas em ({disciplina})'
     else:
@@ -0,0 +1,131 @@
+import os
+import threading
+import pandas as pd
+from typing import Optional
+from lib.utils import journal_path, load_json
+
+PREDICTIONS_FILE = "./data/predict_data/local_predictions.json"
+
+# Tipos das colunas: textos repetidos viram categorias e valores ausentes usam os tipos anuláveis
+PREDICTION_DTYPES = {
+    "question" : "Int64",
+    "model" : "category",
+    "response" : "string",
+    "response_length" : "Int32",
+    "answer" : "category",
+    "correct" : "boolean",
+    "time" : "float64",
+    "discipline" : "category",
+    "timeout" : "float64",
+    "tokens" : "Int32",
+    "early_stop" : "boolean",
+    "time_saved" : "float64",
+    "image_time" : "float64",
+    "vision_time" : "float64",
+    "vision_calls" : "object",
+    "prompt_time" : "float64",
+    "queue_time" : "float64",
+    "ttft" : "float64",
+    "generation_time" : "float64",
+    "prompt_tokens" : "Int32",
+    "eval_time" : "float64",
+    "prompt_eval_time" : "float64",
+    "prompt_layout" : "category",
+    "usage_source" : "category",
+}
+
+def to_prediction_frame(predictions) -> pd.DataFrame:
+    """Converte as predições (dict do JSON ou lista de registros) em um DataFrame tipado."""
+    df = pd.DataFrame(list(predictions.values()) if isinstance(predictions, dict) else list(predictions))
+    for column, dtype in PREDICTION_DTYPES.items():
+        if column not in df.columns:
+            df[column] = pd.Series(None, index=df.index, dtype=dtype)
+        elif column == "question":
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype(dtype)
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+def layout_savings(baseline, candidate) -> pd.DataFrame:
+    """Tempo de processamento do prompt economizado por modelo com outro layout de prompt.
+
+    Compara a mesma questão no mesmo modelo nos dois conjuntos de predições (ex.: o arquivo do question-first e o
+    do instructions-first), sem depender de tokenizador. Só entram pares com a mesma origem de medição: o
+    prompt_eval_duration do backend, ou o tempo até o primeiro token nas gerações interrompidas antes do fim.
+    """
+    columns = ["question", "model", "usage_source", "prompt_layout", "prompt_tokens", "prompt_eval_time"]
+    frames = []
+    for predictions in (baseline, candidate):
+        df = predictions if isinstance(predictions, pd.DataFrame) else to_prediction_frame(predictions)
+        df = df[columns].dropna(subset=["usage_source", "prompt_eval_time"])
+        frames.append(df.astype({"model" : "string", "usage_source" : "string", "prompt_layout" : "string"}))
+
+    df = frames[0].merge(frames[1], on=["question", "model", "usage_source"], suffixes=("_base", "_layout"))
+    df["saved"] = df["prompt_eval_time_base"] - df["prompt_eval_time_layout"]
+    table = df.groupby(["model", "usage_source"]).agg(
+        Questions=("question", "size"),
+        Base=("prompt_layout_base", "first"),
+        Layout=("prompt_layout_layout", "first"),
+        PTok=("prompt_tokens_layout", "mean"),
+        Tpp_base=("prompt_eval_time_base", "mean"),
+        Tpp_layout=("prompt_eval_time_layout", "mean"),
+        Tpsave=("saved", "mean"),
+        Tpsave_total=("saved", "sum"),
+    )
+    table["Tpsave_pct"] = table["Tpsave"] / table["Tpp_base"]
+    return table.reset_index()
+
+
+class PredictionFrame:
+    """Predições carregadas uma única vez em memória e recarregadas apenas quando o arquivo (ou o journal) muda."""
+
+    def __init__(self, filename: str = PREDICTIONS_FILE):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._version = None
+        self._frame = None
+
+    def version(self) -> tuple:
+        version = []
+        for path in (self.filename, journal_path(self.filename)):
+            try:
+                stat = os.stat(path)
+                version.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                version.append(None)
+        return tuple(version)
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        with self._lock:
+            version = self.version()
+            if self._frame is None or version != self._version:
+                self._frame = to_prediction_frame(load_json(self.filename))
+                self._version = version
+            return self._frame
+
+    def query(self, models=None, questions=None, columns: Optional[list[str]] = None) -> pd.DataFrame:
+        """Predições dos modelos nas questões (ids ou dicts de questões); as categorias sem uso são removidas."""
+        df = self.frame
+        mask = pd.Series(True, index=df.index)
+        if models is not None:
+            mask &= df["model"].isin(list(models))
+        if questions is not None:
+            if questions and isinstance(questions[0], dict):
+                questions = [q["id"] for q in questions]
+            mask &= df["question"].isin([int(q) for q in questions])
+
+        result = df.loc[mask, columns] if columns is not None else df.loc[mask]
+        result = result.copy()
+        for column in result.select_dtypes("category").columns:
+            result[column] = result[column].cat.remove_unused_categories()
+        return result
+
+    def records(self, models=None, questions=None) -> dict[str, dict]:
+        """Mesmo formato do get_predict_data: {'questão-modelo': predição}, com None nos valores ausentes."""
+        df = self.query(models, questions)
+        df = df.astype(object).where(df.notna(), None)
+        return {f"{record['question']}-{record['model']}" : record for record in df.to_dict(orient="records")}
+
+
+prediction_frame = PredictionFrame()
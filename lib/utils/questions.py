@@ -0,0 +1,140 @@
+import os
+import json
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from typing import Optional
+
+QUESTIONS_PARQUET = "./data/questoes/questoes.parquet"
+
+# Fontes em ordem de prioridade: registros com o mesmo id nas últimas sobrescrevem as primeiras
+QUESTIONS_SOURCES = [
+    "./data/questoes copy.json",
+    "./data/questoes/questoes.json",
+    "./data/questoes/new_questions.json",
+]
+
+# As imagens são mantidas apenas como referência (caminho do arquivo).
+# "position" guarda a ordem original das fontes: o arquivo é ordenado por ano para os row groups,
+# mas as consultas devolvem as questões na ordem do questoes.json
+POSITION_COLUMN = "position"
+QUESTIONS_SCHEMA = pa.schema([
+    (POSITION_COLUMN, pa.int32()),
+    ("id", pa.int64()),
+    ("year", pa.int16()),
+    ("index", pa.int16()),
+    ("discipline", pa.dictionary(pa.int8(), pa.string())),
+    ("type", pa.dictionary(pa.int8(), pa.string())),
+    ("context", pa.string()),
+    ("alternatives_introduction", pa.string()),
+    ("correct_alternative", pa.dictionary(pa.int8(), pa.string())),
+    ("context_image", pa.string()),
+    *[(column, pa.string()) for alternative in "ABCDE" for column in (alternative, f"{alternative}_file")],
+    ("habilidades", pa.list_(pa.string())),
+    ("skills", pa.list_(pa.string())),
+    ("subjects", pa.list_(pa.string())),
+])
+
+# Questões por row group: permite pular anos inteiros usando as estatísticas do Parquet
+ROW_GROUP_SIZE = 200
+
+def read_questions_json(filename) -> list[dict]:
+    with open(filename, 'r', encoding='utf8') as file:
+        data = json.load(file)
+    return list(data.values()) if isinstance(data, dict) else data
+
+def build_question_store(sources: Optional[list[str]] = None, path: str = QUESTIONS_PARQUET) -> int:
+    """Converte os JSONs de questões em um único Parquet ordenado por (ano, disciplina, id).
+
+    Uma questão sobrescrita por uma fonte posterior mantém a posição da primeira ocorrência.
+    """
+    questions = {}
+    for source in sources or QUESTIONS_SOURCES:
+        if os.path.exists(source):
+            for question in read_questions_json(source):
+                questions[int(question['id'])] = question
+
+    positions = {question_id : position for position, question_id in enumerate(questions)}
+    records = [
+        {**{field.name : question.get(field.name) for field in QUESTIONS_SCHEMA},
+         POSITION_COLUMN : positions[int(question['id'])]}
+        for question in sorted(questions.values(), key=lambda q: (q['year'], q['discipline'], q['id']))
+    ]
+    table = pa.Table.from_pylist(records, schema=QUESTIONS_SCHEMA)
+
+    tmp_path = f"{path}.tmp"
+    pq.write_table(table, tmp_path, row_group_size=ROW_GROUP_SIZE, compression='zstd')
+    os.replace(tmp_path, path)
+    return table.num_rows
+
+def is_outdated(path: str = QUESTIONS_PARQUET, sources: Optional[list[str]] = None) -> bool:
+    if not os.path.exists(path):
+        return True
+    # Arquivos gerados antes de uma mudança de colunas (ex.: sem "position") são refeitos
+    if pq.read_schema(path).names != QUESTIONS_SCHEMA.names:
+        return True
+    mtime = os.path.getmtime(path)
+    return any(os.path.exists(source) and os.path.getmtime(source) > mtime for source in sources or QUESTIONS_SOURCES)
+
+def query_filter(years=None, disciplines=None, types=None, ids=None):
+    filters = []
+    for column, values in (("year", years), ("discipline", disciplines), ("type", types), ("id", ids)):
+        if values is not None:
+            filters.append(pc.field(column).isin(list(values)))
+    if not filters:
+        return None
+    expression = filters[0]
+    for condition in filters[1:]:
+        expression = expression & condition
+    return expression
+
+def query_questions_table(years=None, disciplines=None, types=None, ids=None, columns: Optional[list[str]] = None,
+                          path: str = QUESTIONS_PARQUET) -> pa.Table:
+    """Consulta o Parquet lendo apenas as colunas pedidas e os row groups que podem conter os filtros.
+
+    As linhas voltam na ordem original das fontes (coluna "position"), não na ordem do arquivo.
+    """
+    if is_outdated(path):
+        build_question_store(path=path)
+
+    if ids is not None:
+        ids = [int(i) for i in ids]
+
+    read_columns = columns
+    if columns is not None and POSITION_COLUMN not in columns:
+        read_columns = [*columns, POSITION_COLUMN]
+
+    table = pq.read_table(path, columns=read_columns, filters=query_filter(years, disciplines, types, ids))
+    table = table.sort_by(POSITION_COLUMN)
+    if columns is None or POSITION_COLUMN not in columns:
+        table = table.drop_columns([POSITION_COLUMN])
+    return table
+
+def query_questions(years=None, disciplines=None, types=None, ids=None, columns: Optional[list[str]] = None,
+                    path: str = QUESTIONS_PARQUET) -> list[dict]:
+    """Retorna as questões como lista de dicionários, no mesmo formato do questoes.json."""
+    return query_questions_table(years, disciplines, types, ids, columns, path).to_pylist()
+
+class QuestionIndex:
+    """Índice das questões em memória: ano → disciplina → ids (na ordem original) e id → questão."""
+
+    def __init__(self, questions):
+        if isinstance(questions, dict):
+            questions = questions.values()
+        self.by_id: dict[int, dict] = {}
+        self.tree: dict[int, dict[str, list[int]]] = {}
+        for question in questions:
+            self.by_id[question['id']] = question
+            self.tree.setdefault(question['year'], {}).setdefault(question['discipline'], []).append(question['id'])
+
+        self.years = sorted(self.tree)
+        self.disciplines = {year : sorted(disciplines) for year, disciplines in self.tree.items()}
+
+    def ids(self, year, discipline) -> list[int]:
+        return self.tree.get(year, {}).get(discipline, [])
+
+    def get(self, question_id) -> dict:
+        return self.by_id[question_id]
+
+    def __len__(self):
+        return len(self.by_id)
@@ -0,0 +1,45 @@
+import functools
+import threading
+import warnings
+
+# Estimativa usada quando o encoding do tiktoken não está disponível (ex.: máquina sem rede)
+CHARS_PER_TOKEN = 4
+
+# Custo aproximado, em tokens, de cada imagem enviada ao modelo
+IMAGE_TOKENS = 258
+
+_encoding_lock = threading.Lock()
+
+@functools.cache
+def load_encoding(name):
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        warnings.warn(f"Não foi possível carregar o encoding {name} do tiktoken, usando estimativa por caracteres: {e}")
+        return None
+
+def get_encoding(name="cl100k_base"):
+    with _encoding_lock:
+        return load_encoding(name)
+
+def count_tokens(text) -> int:
+    """Conta os tokens de um texto com o tiktoken."""
+    if not text:
+        return 0
+    if (encoding := get_encoding()) is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def estimate_request_tokens(prompt, images=None) -> int:
+    """Estimativa de tokens de entrada de uma requisição, incluindo as imagens."""
+    return count_tokens(prompt) + IMAGE_TOKENS * len(images or [])
+
+def truncate_tokens(text, max_tokens) -> str:
+    """Corta o texto para no máximo `max_tokens` tokens."""
+    if not text or max_tokens <= 0:
+        return ""
+    if (encoding := get_encoding()) is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
@@ -0,0 +1,150 @@
+import warnings
+import numpy as np
+import pandas as pd
+from scipy.special import expit
+from scipy.stats import norm
+from lib.utils.predictions import prediction_frame
+from lib.utils.microdados import load_items
+from lib.utils.questions import query_questions_table
+
+# Disposição das provas no caderno azul de cada ano, o mesmo das questões: (área, primeira questão, CO_POSICAO
+# da primeira questão nos microdados). Em 2016 os microdados numeram LC, CH, CN, MT e os cadernos CH, CN, LC, MT;
+# em 2017 cada área é numerada a partir de 1.
+LAYOUT_2009 = (("CN", 1, 1), ("CH", 46, 46), ("LC", 91, 91), ("MT", 136, 136))
+LAYOUT_2010 = (("CH", 1, 1), ("CN", 46, 46), ("LC", 91, 91), ("MT", 136, 136))
+LAYOUT_2016 = (("CH", 1, 46), ("CN", 46, 91), ("LC", 91, 1), ("MT", 136, 136))
+LAYOUT_2017 = (("LC", 1, 1), ("CH", 46, 1), ("CN", 91, 1), ("MT", 136, 1))
+LAYOUT_2018 = (("LC", 1, 1), ("CH", 46, 46), ("CN", 91, 91), ("MT", 136, 136))
+
+EXAM_LAYOUTS = {
+    2009 : LAYOUT_2009,
+    **{year : LAYOUT_2010 for year in range(2010, 2016)},
+    2016 : LAYOUT_2016,
+    2017 : LAYOUT_2017,
+    **{year : LAYOUT_2018 for year in range(2018, 2024)},
+}
+
+# Questões de língua estrangeira no início da prova de LC; nos anos listados os microdados trazem as de inglês
+# e depois as de espanhol em posições próprias, deslocando o restante da prova
+LANGUAGE_QUESTIONS = 5
+SEQUENTIAL_LANGUAGE_YEARS = {2017}
+
+# Constante de escala da logística (1.0: parâmetros já na métrica logística)
+D = 1.0
+
+# Grade de quadratura usada na estimação de theta
+THETA_GRID = np.linspace(-4, 4, 161)
+
+def exam_positions() -> pd.DataFrame:
+    """Área e CO_POSICAO dos microdados de cada questão do caderno azul, indexados por (ano, número da questão)."""
+    rows = []
+    for year, layout in EXAM_LAYOUTS.items():
+        for area, first_question, first_position in layout:
+            for offset in range(45):
+                position = first_position + offset
+                if area == "LC" and year in SEQUENTIAL_LANGUAGE_YEARS and offset >= LANGUAGE_QUESTIONS:
+                    position += LANGUAGE_QUESTIONS
+                rows.append((year, first_question + offset, area, position))
+    df = pd.DataFrame(rows, columns=["NU_ANO", "NU_QUESTAO", "SG_AREA", "CO_POSICAO"]).astype({"NU_ANO" : "int16", "NU_QUESTAO" : "int16", "CO_POSICAO" : "int16"})
+    return df.set_index(["NU_ANO", "NU_QUESTAO"])
+
+def item_params() -> pd.DataFrame:
+    """Parâmetros a, b, c e gabarito dos itens do caderno azul da prova regular, indexados por (ano, área, posição)."""
+    items = load_items(columns=["NU_PARAM_A", "NU_PARAM_B", "NU_PARAM_C", "TX_GABARITO", "TP_LINGUA", "IN_ITEM_ABAN", "IN_CADERNO_REFERENCIA"])
+    items = items[(items["IN_CADERNO_REFERENCIA"] == 1) & (items["IN_ITEM_ABAN"].fillna(0) == 0)]
+    items = items.dropna(subset=["NU_PARAM_A", "NU_PARAM_B", "NU_PARAM_C"])
+    # Nas posições de língua estrangeira fica apenas o item de inglês
+    items = items.reset_index().sort_values("TP_LINGUA").drop_duplicates(["NU_ANO", "SG_AREA", "CO_POSICAO"])
+    items["TX_GABARITO"] = items["TX_GABARITO"].astype("string")
+    return items.set_index(["NU_ANO", "SG_AREA", "CO_POSICAO"])[["NU_PARAM_A", "NU_PARAM_B", "NU_PARAM_C", "TX_GABARITO"]]
+
+def join_item_params(predictions) -> pd.DataFrame:
+    """Associa cada predição aos parâmetros TRI do item correspondente.
+
+    A área e a posição vêm da disposição do caderno de cada ano (EXAM_LAYOUTS), e o gabarito dos microdados precisa
+    coincidir com o da questão; predições sem item ou com gabarito divergente são descartadas com um aviso.
+    """
+    df = predictions if isinstance(predictions, pd.DataFrame) else pd.DataFrame(predictions.values() if isinstance(predictions, dict) else predictions)
+    question = pd.to_numeric(df["question"])
+    df = df.assign(
+        NU_ANO=(question // 1000).astype("int16"),
+        NU_QUESTAO=(question % 1000).astype("int16"),
+        response=df["correct"].fillna(False).astype("int8"),
+    )
+    df = df.join(exam_positions(), on=["NU_ANO", "NU_QUESTAO"], how="left")
+
+    answers = query_questions_table(ids=question.dropna().unique(), columns=["id", "correct_alternative"]).to_pandas()
+    answers = answers.set_index("id")["correct_alternative"].astype("string")
+    df["correct_alternative"] = question.map(answers)
+
+    joined = df.join(item_params(), on=["NU_ANO", "SG_AREA", "CO_POSICAO"], how="left")
+    missing = joined["NU_PARAM_A"].isna()
+    mismatch = ~missing & (joined["TX_GABARITO"] != joined["correct_alternative"]).fillna(True)
+
+    if missing.any():
+        ids = sorted(joined.loc[missing, "question"].astype(int).unique().tolist())
+        warnings.warn(f"{len(ids)} questões sem parâmetros TRI nos microdados ficaram fora da nota: {ids}")
+    if mismatch.any():
+        ids = sorted(joined.loc[mismatch, "question"].astype(int).unique().tolist())
+        warnings.warn(f"{len(ids)} questões com gabarito diferente do item dos microdados ficaram fora da nota: {ids}")
+
+    return joined[~missing & ~mismatch].drop(columns=["NU_QUESTAO", "correct_alternative", "TX_GABARITO"])
+
+def probability(theta, a, b, c):
+    """Probabilidade de acerto do modelo logístico de 3 parâmetros, para cada item (linhas) e theta (colunas)."""
+    return c[:, None] + (1 - c[:, None]) * expit(D * a[:, None] * (theta[None, :] - b[:, None]))
+
+def estimate_theta(joined: pd.DataFrame, method="eap", group_by=("model", "SG_AREA")) -> pd.DataFrame:
+    """Estima theta de todos os grupos (ex.: modelo × área) de uma vez, por EAP ou máxima verossimilhança."""
+    group_by = list(group_by)
+    groups = joined.groupby(group_by, observed=True).ngroup().to_numpy()
+    items = joined.groupby(["NU_ANO", "SG_AREA", "CO_POSICAO"], observed=True).ngroup().to_numpy()
+    n_groups, n_items = groups.max() + 1, items.max() + 1
+
+    # Matrizes grupo × item de acertos e de itens respondidos
+    correct = np.zeros((n_groups, n_items))
+    answered = np.zeros((n_groups, n_items))
+    np.add.at(correct, (groups, items), joined["response"].to_numpy())
+    np.add.at(answered, (groups, items), 1)
+
+    params = np.zeros((n_items, 3))
+    params[items] = joined[["NU_PARAM_A", "NU_PARAM_B", "NU_PARAM_C"]].to_numpy()
+    p = np.clip(probability(THETA_GRID, *params.T), 1e-9, 1 - 1e-9)
+
+    # Log-verossimilhança de cada grupo em cada ponto da grade
+    log_likelihood = correct @ np.log(p) + (answered - correct) @ np.log(1 - p)
+
+    if method == "mle":
+        theta = THETA_GRID[log_likelihood.argmax(axis=1)]
+        information = (D * params[:, 0, None]) ** 2 * (1 - p) / p * ((p - params[:, 2, None]) / (1 - params[:, 2, None])) ** 2
+        grid_information = answered @ information
+        se = 1 / np.sqrt(grid_information[np.arange(n_groups), log_likelihood.argmax(axis=1)])
+    elif method == "eap":
+        log_posterior = log_likelihood + norm.logpdf(THETA_GRID)[None, :]
+        posterior = np.exp(log_posterior - log_posterior.max(axis=1, keepdims=True))
+        posterior /= posterior.sum(axis=1, keepdims=True)
+        theta = posterior @ THETA_GRID
+        se = np.sqrt(posterior @ THETA_GRID ** 2 - theta ** 2)
+    else:
+        raise ValueError("O parâmetro 'method' deve ser 'eap' ou 'mle'")
+
+    result = joined.groupby(group_by, observed=True).agg(Items=("response", "size"), OK=("response", "sum")).reset_index()
+    result["Theta"] = theta
+    result["SE"] = se
+    result["Score"] = enem_score(theta)
+    return result
+
+def enem_score(theta):
+    """Converte theta para a escala do ENEM (média 500 e desvio 100 na população de referência)."""
+    return 500 + 100 * np.asarray(theta)
+
+def tri_table(models, questions, method="eap") -> pd.DataFrame:
+    """Nota TRI de cada modelo por área, no formato modelo × área (vazia se nenhuma predição tiver item nos microdados)."""
+    predictions = prediction_frame.query(models, questions)
+    joined = join_item_params(predictions) if len(predictions) else predictions
+    if joined.empty:
+        return pd.DataFrame(columns=["model", "Média"])
+    result = estimate_theta(joined, method=method)
+    table = result.pivot(index="model", columns="SG_AREA", values="Score")
+    table["Média"] = table.mean(axis=1)
+    return table.sort_values("Média", ascending=False).reset_index()
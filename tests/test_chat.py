@@ -0,0 +1,34 @@
+import base64
+from lib.models_help.chat import ChatContext, ChatSessions, LocalContextStore
+
+IMAGE = {'inline_data' : {'mime_type' : 'image/png', 'data' : base64.b64encode(b'imagem').decode('utf-8')}}
+
+def new_chat():
+    return {
+        'system_instruction' : 'instrução',
+        'messages' : [{'role' : 'user', 'parts' : [{'text' : 'questão'}, IMAGE]}, {'role' : 'user', 'parts' : ['dúvida']}],
+        'context' : ChatContext(),
+    }
+
+def test_restored_chat_in_new_store(tmp_path):
+    filename = str(tmp_path / "chats.json")
+    sessions = ChatSessions(filename=filename, max_bytes=1, max_session_bytes=1)
+    chat = sessions.put('aluno', 1, new_chat())
+    LocalContextStore().prepare(1, chat['context'].build(chat['messages'])[0])
+    sessions.put('aluno', 2, new_chat())
+
+    # Outro processo (ou uma página recarregada) restaura o chat do disco com outro armazenamento
+    restored = ChatSessions(filename=filename).get('aluno', 1)
+    assert restored is not None
+    store = LocalContextStore()
+    contents, _ = restored['context'].build(restored['messages'])
+    sent = store.prepare(1, contents)
+    assert sent[0]['parts'][1] == IMAGE
+    assert store.stats['uploads'] == 1
+
+def test_upload_reused_between_requests():
+    store = LocalContextStore()
+    chat = new_chat()
+    for _ in range(2):
+        store.prepare(1, chat['context'].build(chat['messages'])[0])
+    assert store.stats == {'uploads' : 1, 'uploaded_bytes' : 6, 'reused' : 1, 'errors' : 0}
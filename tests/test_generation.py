@@ -0,0 +1,33 @@
+from lib.models_help.generation import AnswerDetector, EarlyStopRules
+
+def feed_all(chunks, rules=EarlyStopRules()):
+    detector = AnswerDetector(rules)
+    stops = [detector.feed(chunk) for chunk in chunks]
+    return detector, stops
+
+def test_listing_split_after_letter():
+    # A letra chega sozinha e o ":" da listagem só no chunk seguinte
+    detector, stops = feed_all(["Let me list:\n", "(A)", ": first option"])
+    assert not any(stops)
+    assert detector.answer is None
+
+def test_answer_split_across_chunks():
+    detector, stops = feed_all(["A resposta é (", "C", ")", ".\n"])
+    assert stops == [False, False, False, True]
+    assert detector.answer == "C"
+
+def test_listing_then_answer():
+    detector, stops = feed_all(["(A): um\n(B): dois\n", "Resposta: (B)", "\n\n"])
+    assert stops[-1]
+    assert detector.answer == "B"
+
+def test_revised_answer_is_not_cut():
+    # A letra citada no raciocínio não encerra a geração; a resposta final é a que vale
+    detector, stops = feed_all(["a opção (B) parece correta, ", "porém o enunciado exclui esse caso, ", "então a resposta final é (C)", ".\n"])
+    assert stops == [False, False, False, True]
+    assert detector.answer == "C"
+
+def test_leading_answer():
+    detector, stops = feed_all(["(D)", "\n\nExplicação: ..."])
+    assert stops[-1]
+    assert detector.answer == "D"